@@ -0,0 +1,271 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import hashlib
+import json
+import random
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeBee:
+    # In-process stand-in for the /bzz API of a Bee node, with injectable
+    # latency (seconds before response headers), bandwidth (bytes/s per response)
+    # and error rate (fraction of requests answered with error_status).
+    # With http2=True it speaks HTTP/2 over plain TCP (h2c with prior knowledge) instead of HTTP/1.1.
+
+    def __init__(self, latency=0.0, bandwidth=None, error_rate=0.0, error_status=503, seed=None, host='127.0.0.1', port=0,
+                 http2=False):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.http2 = http2
+        self.files = {}
+        self.requests = 0
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        if http2:
+            self._server = socketserver.ThreadingTCPServer((host, port), self._make_h2_handler())
+        else:
+            self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def add_file(self, content, mime_type='application/octet-stream', file_name='file.bin'):
+        reference = hashlib.sha256(content).hexdigest()
+        self.files[reference] = (content, mime_type, file_name)
+        return reference
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            return self.error_rate and self._random.random() < self.error_rate
+
+    def _count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    @staticmethod
+    def _json(status_code, obj):
+        return status_code, [('Content-Type', 'application/json')], json.dumps(obj).encode('utf-8')
+
+    def _respond(self, method, path, headers, body):
+        # returns (status code, headers, body) of the response; header names in `headers` are lowercase
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_fail():
+            return self._json(self.error_status, {'message': 'injected error'})
+        parsed = urllib.parse.urlparse(path)
+        if method == 'GET' and parsed.path.startswith('/bzz/'):
+            reference = urllib.parse.unquote(parsed.path[len('/bzz/'):]).rstrip('/')
+            if reference in self.files:
+                content, mime_type, file_name = self.files[reference]
+                return 200, [
+                    ('Content-Type', mime_type),
+                    ('Content-Disposition', 'inline; filename="%s"' % file_name),
+                ], content
+        elif method == 'POST' and parsed.path == '/bzz':
+            query = urllib.parse.parse_qs(parsed.query)
+            reference = self.add_file(
+                body,
+                mime_type=headers.get('content-type', 'application/octet-stream'),
+                file_name=query.get('file_name', ['file.bin'])[0],
+            )
+            return self._json(201, {'reference': reference})
+        return self._json(404, {'message': 'Not Found'})
+
+    def _make_handler(self):
+        bee = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # like Bee itself (Go sets TCP_NODELAY by default), so keep-alive
+            # connections are not penalized by delayed ACKs
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                bee._count_connection()
+
+            def log_message(self, format, *args):
+                pass
+
+            def _write_throttled(self, body):
+                view = memoryview(body)
+                chunk_size = 64 * 1024
+                start = time.perf_counter()
+                for offset in range(0, len(view), chunk_size):
+                    self.wfile.write(view[offset:offset + chunk_size])
+                    if bee.bandwidth:
+                        ahead = (offset + chunk_size) / bee.bandwidth - (time.perf_counter() - start)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    parts = []
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                        if size == 0:
+                            while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                                pass
+                            return b''.join(parts)
+                        parts.append(self.rfile.read(size))
+                        self.rfile.readline()
+                return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            def _handle(self, body):
+                headers = {k.lower(): v for k, v in self.headers.items()}
+                status_code, response_headers, content = bee._respond(self.command, self.path, headers, body)
+                self.send_response(status_code)
+                for name, value in response_headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self._write_throttled(content)
+
+            def do_GET(self):
+                self._handle(b'')
+
+            def do_POST(self):
+                start = time.perf_counter()
+                body = self._read_body()
+                if bee.bandwidth:
+                    behind = len(body) / bee.bandwidth - (time.perf_counter() - start)
+                    if behind > 0:
+                        time.sleep(behind)
+                self._handle(body)
+
+        return Handler
+
+    def _make_h2_handler(self):
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+        bee = self
+
+        class H2Handler(socketserver.BaseRequestHandler):
+            # one connection; each stream is answered on its own thread, so streams are
+            # served concurrently like Bee does, and responses are interleaved by flow control
+
+            def setup(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                bee._count_connection()
+                self.conn = h2.connection.H2Connection(
+                    config=h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+                )
+                self.lock = threading.Lock()
+                self.streams = {}
+                self.pending = {}
+
+            def _flush(self):
+                # sends as much of the pending response bodies as flow control allows; lock held
+                for stream_id, data in list(self.pending.items()):
+                    try:
+                        while data:
+                            window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+                            if window <= 0:
+                                break
+                            self.conn.send_data(stream_id, data[:window].tobytes())
+                            data = data[window:]
+                        if data:
+                            self.pending[stream_id] = data
+                        else:
+                            self.conn.end_stream(stream_id)
+                            del self.pending[stream_id]
+                    except h2.exceptions.StreamClosedError:
+                        del self.pending[stream_id]
+                out = self.conn.data_to_send()
+                if out:
+                    self.request.sendall(out)
+
+            def _respond(self, stream_id, headers, body):
+                start = time.perf_counter()
+                status_code, response_headers, content = bee._respond(headers[':method'], headers[':path'], headers, body)
+                if bee.bandwidth:
+                    behind = (len(body) + len(content)) / bee.bandwidth - (time.perf_counter() - start)
+                    if behind > 0:
+                        time.sleep(behind)
+                with self.lock:
+                    try:
+                        self.conn.send_headers(
+                            stream_id,
+                            [(':status', str(status_code))]
+                            + [(name.lower(), value) for name, value in response_headers]
+                            + [('content-length', str(len(content)))]
+                        )
+                    except h2.exceptions.StreamClosedError:
+                        return
+                    self.pending[stream_id] = memoryview(content)
+                    self._flush()
+
+            def handle(self):
+                with self.lock:
+                    self.conn.initiate_connection()
+                    self.request.sendall(self.conn.data_to_send())
+                while True:
+                    data = self.request.recv(65536)
+                    if not data:
+                        return
+                    with self.lock:
+                        for event in self.conn.receive_data(data):
+                            if isinstance(event, h2.events.RequestReceived):
+                                self.streams[event.stream_id] = (dict(event.headers), [])
+                            elif isinstance(event, h2.events.DataReceived):
+                                self.streams[event.stream_id][1].append(event.data)
+                                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                            elif isinstance(event, h2.events.StreamEnded):
+                                headers, parts = self.streams.pop(event.stream_id)
+                                threading.Thread(
+                                    target=self._respond, args=(event.stream_id, headers, b''.join(parts)), daemon=True
+                                ).start()
+                            elif isinstance(event, h2.events.StreamReset):
+                                self.streams.pop(event.stream_id, None)
+                                self.pending.pop(event.stream_id, None)
+                            elif isinstance(event, h2.events.ConnectionTerminated):
+                                return
+                        self._flush()
+
+        return H2Handler
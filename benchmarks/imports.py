@@ -0,0 +1,75 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import argparse
+import re
+import subprocess
+import sys
+
+
+HEAVY_MODULES = ['requests', 'urllib3', 'pandas', 'pyarrow', 'fastparquet', 'numpy', 'cgi']
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure_import(module='mipasa_swarm_connector'):
+    # returns (cumulative microseconds for `module`, names of all modules it pulled in)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    cumulative = None
+    imported = []
+    for line in proc.stderr.splitlines():
+        m = IMPORT_TIME_LINE.match(line)
+        if m is None:
+            continue
+        imported.append(m.group(4))
+        if m.group(4) == module and not m.group(3).strip(' '):
+            cumulative = int(m.group(2))
+    return cumulative, imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the import time of mipasa_swarm_connector with -X importtime.')
+    parser.add_argument('--module', default='mipasa_swarm_connector')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if the best import time exceeds this many milliseconds')
+    args = parser.parse_args(argv)
+
+    best = None
+    imported = []
+    for _ in range(args.repeat):
+        cumulative, imported = measure_import(args.module)
+        if cumulative is not None and (best is None or cumulative < best):
+            best = cumulative
+
+    heavy = sorted(set(HEAVY_MODULES) & set(name.split('.')[0] for name in imported))
+    print('import %s: %.2f ms (best of %d)' % (args.module, best / 1000, args.repeat))
+    print('modules imported by the interpreter: %d' % len(imported))
+    status = 0
+    if heavy:
+        print('heavy modules imported eagerly: %s' % ', '.join(heavy))
+        status = 1
+    if args.max_ms is not None and best / 1000 > args.max_ms:
+        print('import time exceeds %.2f ms' % args.max_ms)
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
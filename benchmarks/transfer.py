@@ -0,0 +1,269 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import argparse
+import gc
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from mipasa_swarm_connector import SwarmConnection, SwarmAPIError, SharedMemoryCache
+from .fake_bee import FakeBee
+
+
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+FORMATS = ['bytes', 'csv', 'parquet', 'json']
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(text)
+
+
+def format_size(size):
+    for unit in ['GB', 'MB', 'KB']:
+        if size >= SIZE_UNITS[unit]:
+            return '%g%s' % (size / SIZE_UNITS[unit], unit)
+    return '%dB' % size
+
+
+def make_payload(fmt, size):
+    # produces a payload whose encoded size is roughly `size` bytes
+    if fmt == 'bytes':
+        block = bytes(range(256)) * 4096
+        return (block * (size // len(block) + 1))[:size]
+    if fmt == 'json':
+        row = {'id': 0, 'value': 0.5, 'name': 'row-name'}
+        rows = max(1, size // len(json.dumps(row)))
+        return [{'id': i, 'value': i * 0.5, 'name': 'row-%d' % i} for i in range(rows)]
+    import numpy as np
+    import pandas as pd
+    # approximate encoded width of one row with three columns
+    row_bytes = 40 if fmt == 'csv' else 24
+    rows = max(1, size // row_bytes)
+    return pd.DataFrame({
+        'id': np.arange(rows, dtype='int64'),
+        'value': np.arange(rows, dtype='float64') * 0.5,
+        'category': np.arange(rows, dtype='int64') % 100,
+    })
+
+
+def strategy_default(gateway_url, cache_dir):
+    return SwarmConnection(gateway_url)
+
+
+def strategy_session(gateway_url, cache_dir):
+    import requests
+    return SwarmConnection(gateway_url, session=requests.Session())
+
+
+def strategy_cache(gateway_url, cache_dir):
+    import requests
+    return SwarmConnection(gateway_url, session=requests.Session(), cache=SharedMemoryCache(cache_dir))
+
+
+STRATEGIES = {
+    'default': strategy_default,
+    'session': strategy_session,
+    'cache': strategy_cache,
+}
+
+
+def measure(fn, repeat):
+    # failed attempts (e.g. injected gateway errors) are counted, but not timed
+    timings = []
+    errors = 0
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except SwarmAPIError:
+            errors += 1
+            continue
+        timings.append(time.perf_counter() - start)
+    return result, timings, errors
+
+
+def measure_peak_memory(fn):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        try:
+            fn()
+        except SwarmAPIError:
+            return None
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_case(gateway_url, strategy, fmt, size, repeat):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        conn = STRATEGIES[strategy](gateway_url, cache_dir)
+        payload = make_payload(fmt, size)
+
+        def write():
+            return conn.write_file(payload, as_type=fmt)
+
+        def read():
+            return conn.read_file(swarm_hash, as_type=fmt)
+
+        swarm_hash, write_timings, write_errors = measure(write, repeat)
+        write_peak = measure_peak_memory(write)
+        if swarm_hash is not None:
+            _, read_timings, read_errors = measure(read, repeat)
+            read_peak = measure_peak_memory(read)
+        else:
+            read_timings, read_errors, read_peak = [], 0, None
+
+    result = {
+        'strategy': strategy,
+        'format': fmt,
+        'size': size,
+    }
+    for op, timings, errors, peak in [
+        ('write', write_timings, write_errors, write_peak),
+        ('read', read_timings, read_errors, read_peak),
+    ]:
+        median = statistics.median(timings) if timings else None
+        result[op] = {
+            'latency_median': median,
+            'latency_min': min(timings) if timings else None,
+            'latency_max': max(timings) if timings else None,
+            'throughput': size / median if median else None,
+            'errors': errors,
+            'peak_memory': peak,
+        }
+    return result
+
+
+def run(sizes, formats, strategies, repeat=5, latency=0.0, bandwidth=None, error_rate=0.0, gateway_url=None):
+    results = []
+    if gateway_url is not None:
+        for strategy in strategies:
+            for fmt in formats:
+                for size in sizes:
+                    results.append(run_case(gateway_url, strategy, fmt, size, repeat))
+        return results
+    with FakeBee(latency=latency, bandwidth=bandwidth, error_rate=error_rate, seed=0) as bee:
+        return run(sizes, formats, strategies, repeat=repeat, gateway_url=bee.url)
+
+
+def print_report(results, out=sys.stdout):
+    def optional(value, fmt, scale=1):
+        return '-' if value is None else fmt % (value / scale)
+
+    header = '%-10s %-8s %8s %6s %12s %12s %12s %7s' % ('strategy', 'format', 'size', 'op', 'median ms', 'MB/s', 'peak MB', 'errors')
+    print(header, file=out)
+    print('-' * len(header), file=out)
+    for r in results:
+        for op in ['write', 'read']:
+            m = r[op]
+            print('%-10s %-8s %8s %6s %12s %12s %12s %7d' % (
+                r['strategy'], r['format'], format_size(r['size']), op,
+                optional(m['latency_median'], '%.2f', 0.001),
+                optional(m['throughput'], '%.2f', SIZE_UNITS['MB']),
+                optional(m['peak_memory'], '%.2f', SIZE_UNITS['MB']),
+                m['errors'],
+            ), file=out)
+
+
+def compare(results, baseline, max_regression, min_delta=0.0, min_size=0):
+    # returns human-readable descriptions of cases of at least min_size bytes whose median
+    # latency grew by more than max_regression (relative) and min_delta seconds
+    def key(r):
+        return r['strategy'], r['format'], r['size']
+
+    baseline_by_key = {key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = baseline_by_key.get(key(r))
+        if b is None or r['size'] < min_size:
+            continue
+        for op in ['write', 'read']:
+            old = b[op]['latency_median']
+            new = r[op]['latency_median']
+            if old and new and (new - old) / old > max_regression and new - old > min_delta:
+                regressions.append('%s %s %s %s: %.2fms -> %.2fms' % (
+                    r['strategy'], r['format'], format_size(r['size']), op, old * 1000, new * 1000
+                ))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark SwarmConnection reads and writes against a local fake Bee gateway.')
+    parser.add_argument('--sizes', default='1KB,1MB,16MB', help='comma-separated payload sizes, e.g. 1KB,1MB,2GB')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma-separated formats (%s)' % ', '.join(FORMATS))
+    parser.add_argument('--strategies', default=','.join(STRATEGIES), help='comma-separated connection strategies (%s)' % ', '.join(STRATEGIES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='injected gateway latency in seconds')
+    parser.add_argument('--bandwidth', type=parse_size, default=None, help='injected gateway bandwidth per response, e.g. 100MB')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of gateway requests failing with 503')
+    parser.add_argument('--gateway-url', default=None, help='benchmark a real gateway instead of the fake one')
+    parser.add_argument('--json', dest='json_path', default=None, help='write results as JSON to this path')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare against')
+    parser.add_argument('--max-regression', type=float, default=1.0, help='allowed relative latency increase over the baseline')
+    parser.add_argument('--min-regression-ms', type=float, default=250.0,
+                        help='latency increases smaller than this are never failures')
+    parser.add_argument('--gate-min-size', type=parse_size, default=parse_size('16MB'),
+                        help='only cases with payloads of at least this size can fail the comparison')
+    args = parser.parse_args(argv)
+
+    results = run(
+        sizes=[parse_size(s) for s in args.sizes.split(',')],
+        formats=args.formats.split(','),
+        strategies=args.strategies.split(','),
+        repeat=args.repeat,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        gateway_url=args.gateway_url,
+    )
+    print_report(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        # timings of small payloads on shared machines vary by more than any useful threshold,
+        # so they are only reported; large payloads fail on gross regressions
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.max_regression)
+        regressions = compare(
+            results, baseline, args.max_regression, min_delta=args.min_regression_ms / 1000, min_size=args.gate_min_size
+        )
+        if slower:
+            print('\nSlower than the baseline by over %d%%:' % (args.max_regression * 100))
+            for line in slower:
+                print('  %s%s' % (line, '' if line in regressions else ' (not gated)'))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
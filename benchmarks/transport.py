@@ -0,0 +1,120 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import argparse
+import sys
+import time
+
+from mipasa_swarm_connector import SwarmConnection, AdaptiveLimiter, RequestsTransport, HTTPXTransport
+from .fake_bee import FakeBee
+from .transfer import parse_size, format_size
+
+
+def transport_requests():
+    import requests
+    return RequestsTransport(requests.Session())
+
+
+def transport_httpx_http1():
+    return HTTPXTransport(http2=False)
+
+
+def transport_httpx_http2():
+    # negotiates HTTP/2 over TLS (ALPN), so it needs an https:// gateway
+    return HTTPXTransport(http2=True)
+
+
+def transport_httpx_h2c():
+    # HTTP/2 with prior knowledge, for plain-text gateways which speak HTTP/2
+    return HTTPXTransport(http1=False, http2=True)
+
+
+TRANSPORTS = {
+    'requests': transport_requests,
+    'httpx-http1': transport_httpx_http1,
+    'httpx-http2': transport_httpx_http2,
+    'httpx-h2c': transport_httpx_h2c,
+}
+
+# protocol the fake gateway is started with for each transport
+FAKE_GATEWAY_HTTP2 = {
+    'requests': False,
+    'httpx-http1': False,
+    'httpx-h2c': True,
+}
+
+
+def run_case(gateway_url, transport_name, references, fan_out, repeat):
+    transport = TRANSPORTS[transport_name]()
+    try:
+        conn = SwarmConnection(
+            gateway_url,
+            transport=transport,
+            concurrency=AdaptiveLimiter(initial_limit=fan_out, min_limit=fan_out, max_limit=fan_out),
+        )
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.read_files(references, as_type='bytes')
+            timings.append(time.perf_counter() - start)
+    finally:
+        transport.close()
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare transports under high fan-out reads.')
+    parser.add_argument('--transports', default='requests,httpx-http1,httpx-h2c',
+                        help='comma-separated transports (%s); httpx-http2 needs --gateway-url with TLS' % ', '.join(TRANSPORTS))
+    parser.add_argument('--files', type=int, default=256, help='number of files read per round')
+    parser.add_argument('--size', type=parse_size, default=parse_size('16KB'))
+    parser.add_argument('--fan-out', type=int, default=64, help='requests in flight')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.02, help='injected gateway latency in seconds')
+    parser.add_argument('--gateway-url', default=None, help='benchmark a real gateway; --references must then be given')
+    parser.add_argument('--references', default=None, help='comma-separated references to read from a real gateway')
+    args = parser.parse_args(argv)
+
+    names = args.transports.split(',')
+    if not args.gateway_url:
+        unsupported = [name for name in names if name not in FAKE_GATEWAY_HTTP2]
+        if unsupported:
+            parser.error('%s cannot run against the plain-text fake gateway; use --gateway-url' % ', '.join(unsupported))
+
+    print('%-12s %-10s %8s %8s %8s %12s %12s' % ('transport', 'gateway', 'files', 'size', 'fan-out', 'round ms', 'connections'))
+    for name in names:
+        if args.gateway_url:
+            references = args.references.split(',')
+            best = run_case(args.gateway_url, name, references, args.fan_out, args.repeat)
+            gateway = 'external'
+            connections = '-'
+        else:
+            http2 = FAKE_GATEWAY_HTTP2[name]
+            with FakeBee(latency=args.latency, http2=http2) as bee:
+                block = bytes(range(256)) * (args.size // 256 + 1)
+                references = [bee.add_file(b'%08d' % i + block[:max(0, args.size - 8)]) for i in range(args.files)]
+                best = run_case(bee.url, name, references, args.fan_out, args.repeat)
+                gateway = 'h2c' if http2 else 'http/1.1'
+                connections = str(bee.connections)
+        print('%-12s %-10s %8d %8s %8d %12.2f %12s' % (
+            name, gateway, len(references), format_size(args.size), args.fan_out, best * 1000, connections
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import threading
+import time
+from contextlib import contextmanager
+from .errors import SwarmAPIError, SwarmBatchError
+
+CHUNK_SIZE = 4096
+CHUNK_BRANCHES = 128
+# chunks of the manifest and metadata which /bzz uploads create besides the file itself
+MANIFEST_CHUNKS = 8
+
+
+def estimate_chunks(size):
+    # data chunks plus the intermediate chunks of the chunk tree
+    level = max(1, -(-size // CHUNK_SIZE))
+    total = level
+    while level > 1:
+        level = -(-level // CHUNK_BRANCHES)
+        total += level
+    return total + MANIFEST_CHUNKS
+
+
+class PostageBatch:
+    def __init__(self, batch_id, depth, bucket_depth, utilization, usable=True, immutable=True, ttl=None):
+        self.batch_id = batch_id
+        self.depth = depth
+        self.bucket_depth = bucket_depth
+        self.utilization = utilization
+        self.usable = usable
+        self.immutable = immutable
+        self.ttl = ttl
+        self.reserved_chunks = 0
+
+    def __repr__(self):
+        return "<PostageBatch %s utilization=%d/%d>" % (self.batch_id, self.utilization, self.bucket_capacity)
+
+    @classmethod
+    def from_api(cls, data):
+        return cls(
+            batch_id=data['batchID'],
+            depth=int(data['depth']),
+            bucket_depth=int(data['bucketDepth']),
+            utilization=int(data.get('utilization', 0)),
+            usable=bool(data.get('usable', True)) and bool(data.get('exists', True)),
+            immutable=bool(data.get('immutableFlag', True)),
+            ttl=data.get('batchTTL'),
+        )
+
+    @property
+    def bucket_capacity(self):
+        return 2 ** (self.depth - self.bucket_depth)
+
+    @property
+    def remaining_chunks(self):
+        # utilization is the fill of the fullest bucket, so this is the capacity
+        # left if chunks keep spreading evenly over all buckets
+        free = max(0, self.bucket_capacity - self.utilization) * 2 ** self.bucket_depth
+        return max(0, free - self.reserved_chunks)
+
+
+class PostageBatchManager:
+    # Tracks capacity of postage batches owned by the node, so that uploads pick a
+    # batch with room before sending any data. Chunks are not spread perfectly evenly
+    # over buckets, so an upload is only placed in a batch with `safety_factor` times
+    # the estimated number of chunks left.
+
+    def __init__(self, batch_ids=None, refresh_interval=60.0, safety_factor=2.0):
+        self.batch_ids = list(batch_ids) if batch_ids is not None else None
+        self.refresh_interval = refresh_interval
+        self.safety_factor = safety_factor
+        self.batches = {}
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<PostageBatchManager batches=%d>" % len(self.batches)
+
+    def refresh(self, conn):
+        r = conn.transport.request('GET', '%s/stamps' % conn.gateway_url)
+        if r.status_code != 200:
+            raise SwarmAPIError('Postage batches could not be retrieved from Swarm (code %d)' % r.status_code, status_code=r.status_code)
+        batches = {}
+        for data in r.json().get('stamps') or []:
+            batch = PostageBatch.from_api(data)
+            if self.batch_ids is None or batch.batch_id in self.batch_ids:
+                batches[batch.batch_id] = batch
+        with self._lock:
+            self.batches = batches
+            self._refreshed_at = time.monotonic()
+
+    def invalidate(self, batch_id=None):
+        with self._lock:
+            if batch_id is not None and batch_id in self.batches:
+                self.batches[batch_id].usable = False
+            self._refreshed_at = None
+
+    def _refresh_if_stale(self, conn):
+        with self._lock:
+            stale = self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.refresh_interval
+        if stale:
+            self.refresh(conn)
+
+    def reserve(self, conn, size, batch_id=None):
+        # returns a batch id with room for `size` bytes and accounts for it until the next refresh
+        return self._reserve(conn, size, batch_id)[0]
+
+    @contextmanager
+    def reserved(self, conn, size, batch_id=None):
+        # like reserve(), but gives the reservation back if the upload fails,
+        # so failed and retried uploads do not use up the batch
+        batch_id, batch, required = self._reserve(conn, size, batch_id)
+        try:
+            yield batch_id
+        except BaseException:
+            self._release(batch, required)
+            raise
+
+    def _reserve(self, conn, size, batch_id):
+        self._refresh_if_stale(conn)
+        required = estimate_chunks(size)
+        needed = required * self.safety_factor
+        with self._lock:
+            if batch_id is not None:
+                batch = self.batches.get(batch_id)
+                if batch is None:
+                    # not one of ours; nothing is known about it, so let the node decide
+                    return batch_id, None, required
+                candidates = [batch]
+            else:
+                candidates = list(self.batches.values())
+            candidates = [b for b in candidates if b.usable and b.remaining_chunks >= needed]
+            if not candidates:
+                raise SwarmBatchError(
+                    'No usable postage batch has room for %d chunks (%d bytes)' % (required, size),
+                    batch_id=batch_id,
+                    required_chunks=required,
+                )
+            batch = max(candidates, key=lambda b: b.remaining_chunks)
+            batch.reserved_chunks += required
+            return batch.batch_id, batch, required
+
+    def _release(self, batch, required):
+        if batch is None:
+            return
+        with self._lock:
+            # a refresh since the reservation replaced the batch, and with it the reservation
+            if self.batches.get(batch.batch_id) is batch:
+                batch.reserved_chunks = max(0, batch.reserved_chunks - required)
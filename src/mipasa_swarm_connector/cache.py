@@ -0,0 +1,212 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import os
+import mmap
+import stat
+import tempfile
+import threading
+import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class MemoryCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<MemoryCache>"
+
+    def __contains__(self, swarm_hash):
+        return swarm_hash in self._entries
+
+    def get(self, swarm_hash):
+        with self._lock:
+            entry = self._entries.get(swarm_hash)
+            if entry is not None:
+                self._entries.move_to_end(swarm_hash)
+            return entry
+
+    def put(self, swarm_hash, content, data_type):
+        with self._lock:
+            if swarm_hash in self._entries:
+                return
+            self._entries[swarm_hash] = (content, data_type)
+            self._size += len(content)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def size(self):
+        return self._size
+
+    def discard(self, swarm_hash):
+        with self._lock:
+            entry = self._entries.pop(swarm_hash, None)
+            if entry is not None:
+                self._size -= len(entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class SharedMemoryCache:
+    # Swarm references are content addressed, so a cached entry never goes stale;
+    # the only coordination needed between processes is publishing and eviction.
+    DATA_SUFFIX = '.data'
+    META_SUFFIX = '.meta'
+
+    def __init__(self, directory=None, max_bytes=1024 * 1024 * 1024):
+        if directory is None:
+            base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            directory = os.path.join(base, 'mipasa-swarm-cache-%s' % (os.getuid() if hasattr(os, 'getuid') else os.getlogin()))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_owner(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock_path = os.path.join(directory, '.lock')
+
+    def __repr__(self):
+        return "<SharedMemoryCache %s>" % self.directory
+
+    @staticmethod
+    def _check_owner(directory):
+        # entries are trusted as the content of their reference, so nobody else may be able to plant them
+        st = os.lstat(directory)
+        if not stat.S_ISDIR(st.st_mode):
+            raise PermissionError('Cache directory %s is not a directory' % directory)
+        if hasattr(os, 'getuid') and st.st_uid != os.getuid():
+            raise PermissionError('Cache directory %s is owned by another user' % directory)
+
+    def _entry_path(self, swarm_hash, suffix):
+        return os.path.join(self.directory, urllib.parse.quote(swarm_hash, safe='') + suffix)
+
+    def path(self, swarm_hash):
+        return self._entry_path(swarm_hash, self.DATA_SUFFIX)
+
+    def __contains__(self, swarm_hash):
+        return os.path.exists(self.path(swarm_hash))
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def get(self, swarm_hash):
+        data_path = self.path(swarm_hash)
+        try:
+            with open(data_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size:
+                    view = memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+                else:
+                    view = memoryview(b'')
+            with open(self._entry_path(swarm_hash, self.META_SUFFIX), 'r') as f:
+                data_type = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            # the modification time is the LRU clock shared by all processes
+            os.utime(data_path)
+        except FileNotFoundError:
+            pass
+        return view, data_type
+
+    def put(self, swarm_hash, content, data_type):
+        data_path = self.path(swarm_hash)
+        if os.path.exists(data_path):
+            return
+        # metadata goes first and data is published with an atomic rename,
+        # so a reader that finds the data file always finds its metadata too
+        self._write_atomic(self._entry_path(swarm_hash, self.META_SUFFIX), data_type.encode('utf-8'))
+        self._write_atomic(data_path, content)
+        self.evict()
+
+    def _write_atomic(self, path, content):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(self.DATA_SUFFIX):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.name[:-len(self.DATA_SUFFIX)]))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        with self._locked():
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, name in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(name)
+                total -= size
+
+    def _remove(self, name):
+        # mapped views of an evicted entry stay valid in other processes until released
+        for suffix in (self.DATA_SUFFIX, self.META_SUFFIX):
+            try:
+                os.unlink(os.path.join(self.directory, name + suffix))
+            except FileNotFoundError:
+                pass
+
+    def discard(self, swarm_hash):
+        with self._locked():
+            self._remove(urllib.parse.quote(swarm_hash, safe=''))
+
+    def clear(self):
+        with self._locked():
+            for _, _, name in self._entries():
+                self._remove(name)
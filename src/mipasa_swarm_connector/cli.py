@@ -0,0 +1,346 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import argparse
+import errno
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .errors import SwarmError
+
+INDEX_FORMAT = 'mipasa-swarm-index'
+INDEX_VERSION = 1
+
+SYNC_JOURNAL_NAME = '.swarm-sync-journal.jsonl'
+
+MIME_TYPES = {
+    '.parquet': 'application/vnd.apache.parquet',
+    '.csv': 'text/csv',
+    '.json': 'application/json',
+    '.txt': 'text/plain',
+}
+
+
+class Journal:
+    # append-only JSON lines file recording completed transfers, so that an
+    # interrupted job can be resumed by skipping what is already done
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self._lock = threading.Lock()
+        self._needs_newline = False
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    self._needs_newline = not line.endswith('\n')
+                    try:
+                        self.entries.append(json.loads(line))
+                    except ValueError:
+                        # a line cut short by an interruption
+                        continue
+
+    def find(self, **keys):
+        for entry in reversed(self.entries):
+            if all(entry.get(k) == v for k, v in keys.items()):
+                return entry
+        return None
+
+    def record(self, entry):
+        with self._lock:
+            self.entries.append(entry)
+            if self.path is None:
+                return
+            with open(self.path, 'a') as f:
+                if self._needs_newline:
+                    f.write('\n')
+                    self._needs_newline = False
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+
+
+class TransferStats:
+    def __init__(self):
+        self.sizes = []
+        self.latencies = []
+        self.skipped = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, size, seconds):
+        with self._lock:
+            self.sizes.append(size)
+            self.latencies.append(seconds)
+
+    @staticmethod
+    def _percentile(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def summary(self, operation):
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.sizes)
+        lines = ['%s: %d transferred, %d skipped, %d failed, %s in %.2f s (%.2f MB/s)' % (
+            operation, len(self.sizes), self.skipped, self.failed, format_size(total), elapsed,
+            total / elapsed / 1024 / 1024 if elapsed > 0 else 0.0
+        )]
+        if self.latencies:
+            lines.append('latency per file: p50 %.3f s, p95 %.3f s, max %.3f s' % (
+                self._percentile(self.latencies, 0.5), self._percentile(self.latencies, 0.95), max(self.latencies)
+            ))
+        return '\n'.join(lines)
+
+
+def format_size(size):
+    for unit, scale in [('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)]:
+        if size >= scale:
+            return '%.2f %s' % (size / scale, unit)
+    return '%d B' % size
+
+
+def guess_mime_type(path):
+    _, ext = os.path.splitext(path)
+    if ext.lower() in MIME_TYPES:
+        return MIME_TYPES[ext.lower()]
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def walk_files(paths, exclude=()):
+    # yields (path, path relative to the given root) for every file under the given paths
+    exclude = set(os.path.abspath(p) for p in exclude)
+    for root in paths:
+        if not os.path.exists(root):
+            # os.walk skips missing roots without an error
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), root)
+        if os.path.isfile(root):
+            yield root, os.path.basename(root)
+            continue
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            for name in sorted(file_names):
+                path = os.path.join(dir_path, name)
+                if os.path.abspath(path) not in exclude:
+                    yield path, os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def run_parallel(tasks, jobs, stats, err):
+    # runs (label, fn) tasks where fn returns the transferred size or None if skipped
+    results = {}
+
+    def timed(fn):
+        start = time.perf_counter()
+        size = fn()
+        return size, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = dict((executor.submit(timed, fn), label) for label, fn in tasks)
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                size, seconds = future.result()
+            except (SwarmError, OSError) as e:
+                stats.failed += 1
+                print('failed: %s: %s' % (label, e), file=err)
+                continue
+            if size is None:
+                stats.skipped += 1
+            else:
+                stats.add(size, seconds)
+            results[label] = size
+    return results
+
+
+def _upload_path(conn, path, file_name, batch_id):
+    def attempt():
+        with open(path, 'rb') as f:
+            return conn.write_from_file(f, file_name, mime_type=guess_mime_type(path), batch_id=batch_id)
+    return conn._retry_throttled(attempt)
+
+
+def _download_path(conn, reference, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    part_path = path + '.part'
+
+    def attempt():
+        with open(part_path, 'wb') as f:
+            return conn.read_to_file(reference, f)
+    size = conn._retry_throttled(attempt)
+    os.replace(part_path, path)
+    return size
+
+
+def put_files(conn, files, journal, batch_id, jobs, stats, out, err):
+    # uploads (path, name) pairs; returns {name: (reference, size)}
+    uploaded = {}
+    lock = threading.Lock()
+
+    def task(path, name):
+        def fn():
+            st = os.stat(path)
+            key = dict(op='put', path=os.path.abspath(path), size=st.st_size, mtime_ns=st.st_mtime_ns)
+            done = journal.find(**key)
+            if done is not None:
+                reference, size = done['reference'], None
+            else:
+                reference = _upload_path(conn, path, os.path.basename(path), batch_id)
+                journal.record(dict(key, reference=reference))
+                size = st.st_size
+            with lock:
+                uploaded[name] = (reference, st.st_size)
+            print('%s\t%s' % (reference, path), file=out)
+            return size
+        return fn
+
+    run_parallel([(path, task(path, name)) for path, name in files], jobs, stats, err)
+    return uploaded
+
+
+def get_files(conn, targets, journal, jobs, stats, out, err):
+    # downloads (reference, path) pairs
+    def task(reference, path):
+        def fn():
+            key = dict(op='get', reference=reference, path=os.path.abspath(path))
+            if journal.find(**key) is not None and os.path.exists(path):
+                return None
+            size = _download_path(conn, reference, path)
+            journal.record(dict(key, size=size))
+            print('%s\t%s' % (reference, path), file=out)
+            return size
+        return fn
+
+    run_parallel([('%s -> %s' % (reference, path), task(reference, path)) for reference, path in targets], jobs, stats, err)
+
+
+def safe_join(root, relative_path):
+    path = os.path.normpath(os.path.join(root, *relative_path.split('/')))
+    if os.path.commonpath([os.path.abspath(root), os.path.abspath(path)]) != os.path.abspath(root):
+        raise ValueError('Path %r escapes the output directory' % relative_path)
+    return path
+
+
+def command_get(conn, args, out, err):
+    from .prefetch import load_manifest_references
+
+    targets = []
+    references = list(args.references)
+    if args.input:
+        references += load_manifest_references(args.input)
+    for reference in references:
+        targets.append((reference, os.path.join(args.output, reference)))
+    if args.index:
+        index = conn.read_file(args.index, as_type='json')
+        if not isinstance(index, dict) or index.get('format') != INDEX_FORMAT:
+            raise SwarmError('Hash %s is not a directory index' % repr(args.index), swarm_hash=args.index)
+        for relative_path, entry in sorted(index['files'].items()):
+            targets.append((entry['reference'], safe_join(args.output, relative_path)))
+    if not targets:
+        raise ValueError('No references to download')
+
+    stats = TransferStats()
+    get_files(conn, targets, Journal(args.journal), args.jobs, stats, out, err)
+    return stats
+
+
+def command_put(conn, args, out, err):
+    stats = TransferStats()
+    files = list(walk_files(args.paths, exclude=[args.journal] if args.journal else []))
+    put_files(conn, files, Journal(args.journal), args.batch_id, args.jobs, stats, out, err)
+    return stats
+
+
+def command_sync(conn, args, out, err):
+    journal_path = args.journal or os.path.join(args.directory, SYNC_JOURNAL_NAME)
+    stats = TransferStats()
+    files = [(path, name) for path, name in walk_files([args.directory], exclude=[journal_path])]
+    uploaded = put_files(conn, files, Journal(journal_path), args.batch_id, args.jobs, stats, out, err)
+    if stats.failed:
+        return stats
+    index = {
+        'format': INDEX_FORMAT,
+        'version': INDEX_VERSION,
+        'files': dict((name, {'reference': reference, 'size': size}) for name, (reference, size) in sorted(uploaded.items())),
+    }
+    reference = conn.write_file(index, file_name='index.json', as_type='json', batch_id=args.batch_id)
+    print('%s\t%s' % (reference, 'index.json'), file=out)
+    return stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='swarm-connector', description='Bulk transfers to and from Swarm.')
+    parser.add_argument('--gateway-url', default=None, help='Bee node URL (defaults to $BEE_GATEWAY_URL)')
+    parser.add_argument('--jobs', '-j', type=int, default=8, help='number of files transferred in parallel')
+    parser.add_argument('--quiet', '-q', action='store_true', help='do not print the summary')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    get = subparsers.add_parser('get', help='download references to files')
+    get.add_argument('references', nargs='*', help='references to download')
+    get.add_argument('--input', '-i', help='file listing references (one per line, JSON list or dataset manifest)')
+    get.add_argument('--index', help='reference of a directory index created by sync, to restore the directory tree')
+    get.add_argument('--output', '-o', default='.', help='output directory')
+    get.add_argument('--journal', help='journal file for resuming interrupted downloads')
+
+    for name, help_text in [('put', 'upload files and directory trees'), ('sync', 'upload changed files of a directory and a directory index')]:
+        sub = subparsers.add_parser(name, help=help_text)
+        if name == 'put':
+            sub.add_argument('paths', nargs='+', help='files and directories to upload')
+            sub.add_argument('--journal', help='journal file for resuming interrupted uploads')
+        else:
+            sub.add_argument('directory', help='directory to upload')
+            sub.add_argument('--journal', help='journal file (defaults to %s in the directory)' % SYNC_JOURNAL_NAME)
+        sub.add_argument('--batch-id', default=None, help='postage batch ID')
+        sub.add_argument('--auto-batch', action='store_true', help='choose among the node\'s postage batches automatically')
+    return parser
+
+
+def main(argv=None, out=None, err=None):
+    from .client import SwarmConnection
+
+    out = out or sys.stdout
+    err = err or sys.stderr
+    args = build_parser().parse_args(argv)
+
+    batches = None
+    if getattr(args, 'auto_batch', False):
+        from .batches import PostageBatchManager
+        batches = PostageBatchManager()
+
+    try:
+        conn = SwarmConnection(args.gateway_url, batches=batches)
+        if args.command == 'get':
+            stats = command_get(conn, args, out, err)
+        elif args.command == 'put':
+            stats = command_put(conn, args, out, err)
+        else:
+            stats = command_sync(conn, args, out, err)
+    except (SwarmError, ValueError, OSError) as e:
+        print('error: %s' % e, file=err)
+        return 2
+
+    if not args.quiet:
+        print(stats.summary(args.command), file=err)
+    return 1 if stats.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import os
+import json
+import random
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from .errors import SwarmClientError, SwarmAPIError, SwarmTypeError
+from .detection import detect_type, detect_upload_type
+from .formats import decode, encode, check_backend
+from .instrumentation import Instrumentation
+from .concurrency import AdaptiveLimiter, TokenBucket, ThrottledBody
+from .batches import PostageBatchManager
+from .cache import MemoryCache
+from .prefetch import Prefetcher, load_manifest_references
+from .transport import RequestsTransport
+
+THROTTLE_STATUS_CODES = (429, 503)
+BATCH_EXHAUSTED_STATUS_CODE = 402
+
+
+class SwarmConnection:
+    def __init__(self, gateway_url=None, session=None, cache=None, instrumentation=None, concurrency=None, bandwidth_limit=None, batches=None, prefetch_workers=4, transport=None, backend='pandas'):
+        if not gateway_url:
+            gateway_url = os.getenv('BEE_GATEWAY_URL')
+        if not gateway_url:
+            raise SwarmClientError("""Swarm gateway URL is not specified.
+Please either specify the URL explicitly in SwarmConnection() constructor,
+ or set the environment variable BEE_GATEWAY_URL to the desired address.""")
+        self.gateway_url = gateway_url
+        self.session = session
+        self.transport = transport or RequestsTransport(session)
+        self.cache = cache
+        self.instrumentation = instrumentation or Instrumentation()
+        self.concurrency = concurrency or AdaptiveLimiter()
+        if bandwidth_limit is not None and not isinstance(bandwidth_limit, TokenBucket):
+            bandwidth_limit = TokenBucket(bandwidth_limit)
+        self.bandwidth_limit = bandwidth_limit
+        if batches is not None and not isinstance(batches, PostageBatchManager):
+            batches = PostageBatchManager(batch_ids=batches)
+        self.batches = batches
+        self.prefetch_workers = prefetch_workers
+        check_backend(backend)
+        self.backend = backend
+        self._prefetcher = None
+
+    def __repr__(self):
+        return "<SwarmConnection>"
+
+    def _read_file_internal(self, swarm_hash):
+        if self.cache is not None:
+            cached = self.cache.get(swarm_hash)
+            if cached is None and self._prefetcher is not None:
+                future = self._prefetcher.in_flight(swarm_hash)
+                if future is not None:
+                    # join the background download instead of starting another one;
+                    # if it failed, the download below reports the error
+                    try:
+                        future.result()
+                    except Exception:
+                        pass
+                    else:
+                        cached = self.cache.get(swarm_hash)
+            self.instrumentation.on_cache('read', cached is not None)
+            if cached is not None:
+                return cached
+
+        return self._download(swarm_hash)
+
+    def _request_read(self, swarm_hash, slot):
+        # sends the request and returns the response once its headers are received;
+        # returns (response, time headers were received)
+        start = time.perf_counter()
+        try:
+            r = self.transport.request(
+                'GET',
+                '%s/bzz/%s' % (self.gateway_url, urllib.parse.quote(swarm_hash)),
+                stream=True
+            )
+        except Exception:
+            self.instrumentation.on_request('read', self.gateway_url, None, 0, 0)
+            raise
+        headers_received = time.perf_counter()
+        connect_time = getattr(r, 'connect_time', None)
+        if connect_time is not None:
+            self.instrumentation.on_phase('read', 'connect', connect_time)
+        self.instrumentation.on_phase('read', 'ttfb', headers_received - start)
+        slot.observe_latency(headers_received - start)
+
+        if r.status_code != 200:
+            r.close()
+            if r.status_code in THROTTLE_STATUS_CODES:
+                slot.throttle()
+            self.instrumentation.on_request('read', self.gateway_url, r.status_code, 0, 0)
+            raise SwarmAPIError(
+                'Hash %s not found or could not be retrieved from Swarm (code %d)'
+                % (repr(swarm_hash), r.status_code),
+                swarm_hash=swarm_hash,
+                status_code=r.status_code,
+            )
+        return r, headers_received
+
+    def _download(self, swarm_hash):
+        with self.concurrency.slot() as slot:
+            r, headers_received = self._request_read(swarm_hash, slot)
+            if self.bandwidth_limit is None:
+                content = r.content
+            else:
+                chunks = []
+                try:
+                    for chunk in r.iter_content(ThrottledBody.CHUNK_SIZE):
+                        self.bandwidth_limit.consume(len(chunk))
+                        chunks.append(chunk)
+                finally:
+                    r.close()
+                content = b''.join(chunks)
+            self.instrumentation.on_phase('read', 'transfer', time.perf_counter() - headers_received)
+            self.instrumentation.on_request('read', self.gateway_url, r.status_code, len(content), 0)
+
+        data_type = detect_type(r.headers)
+        if self.cache is not None:
+            try:
+                self.cache.put(swarm_hash, content, data_type)
+            except OSError:
+                # e.g. a full /dev/shm; the file was downloaded, so the read still succeeds
+                pass
+        return content, data_type
+
+    def read_to_file(self, swarm_hash, f, chunk_size=1024 * 1024):
+        # streams the file into a writable binary file object; returns the number of bytes written
+        if self.cache is not None:
+            cached = self.cache.get(swarm_hash)
+            self.instrumentation.on_cache('read', cached is not None)
+            if cached is not None:
+                f.write(cached[0])
+                return len(cached[0])
+
+        written = 0
+        with self.concurrency.slot() as slot:
+            r, headers_received = self._request_read(swarm_hash, slot)
+            try:
+                for chunk in r.iter_content(chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+                    if self.bandwidth_limit is not None:
+                        self.bandwidth_limit.consume(len(chunk))
+            finally:
+                r.close()
+            self.instrumentation.on_phase('read', 'transfer', time.perf_counter() - headers_received)
+            self.instrumentation.on_request('read', self.gateway_url, r.status_code, written, 0)
+        return written
+
+    def read_file(self, swarm_hash, as_type=None, verify_type=False, backend=None, lazy=False):
+        allowed_types = [None, 'text', 'bytes', 'csv', 'parquet', 'json']
+        if as_type not in allowed_types:
+            raise ValueError('Unsupported type %s (expected one of %s)' % (repr(as_type), ', '.join(map(repr, allowed_types))))
+        if backend is None:
+            backend = self.backend
+        check_backend(backend, lazy=lazy)
+
+        content, data_type = self._read_file_internal(swarm_hash)
+
+        if as_type == "bytes":
+            return bytes(content)
+
+        if verify_type and as_type is not None and data_type != as_type:
+            raise SwarmTypeError(
+                'Hash %s is not of type %s' % (repr(swarm_hash), repr(as_type)),
+                swarm_hash=swarm_hash,
+                expected_type=as_type,
+                actual_type=data_type
+            )
+
+        if as_type is None:
+            as_type = data_type
+
+        start = time.perf_counter()
+        result = decode(content, as_type, backend=backend, lazy=lazy)
+        self.instrumentation.on_phase('read', 'decode', time.perf_counter() - start)
+        return result
+
+    def read_csv(self, swarm_hash, backend=None, lazy=False):
+        return self.read_file(swarm_hash, as_type="csv", backend=backend, lazy=lazy)
+
+    def read_parquet(self, swarm_hash, backend=None, lazy=False):
+        return self.read_file(swarm_hash, as_type="parquet", backend=backend, lazy=lazy)
+
+    def read_json(self, swarm_hash):
+        return self.read_file(swarm_hash, as_type="json")
+
+    def prefetch(self, swarm_hashes, priority=0):
+        if isinstance(swarm_hashes, str):
+            swarm_hashes = [swarm_hashes]
+        if self.cache is None:
+            self.cache = MemoryCache()
+        if self._prefetcher is None:
+            self._prefetcher = Prefetcher(self, max_workers=self.prefetch_workers)
+        return [self._prefetcher.submit(swarm_hash, priority=priority) for swarm_hash in swarm_hashes]
+
+    def warm_cache(self, manifest_path, priority=0):
+        return self.prefetch(load_manifest_references(manifest_path), priority=priority)
+
+    def close(self):
+        if self._prefetcher is not None:
+            self._prefetcher.shutdown()
+            self._prefetcher = None
+        self.transport.close()
+
+    def _retry_throttled(self, fn, *args, max_retries=3, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except SwarmAPIError as e:
+                if e.status_code not in THROTTLE_STATUS_CODES or attempt >= max_retries:
+                    raise
+            time.sleep(min(5.0, 0.1 * 2 ** attempt) * random.uniform(0.5, 1.0))
+            attempt += 1
+
+    def _map_concurrently(self, fn, items):
+        # the limiter, not the pool size, decides how many requests are in flight
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(items), self.concurrency.max_limit)) as executor:
+            return list(executor.map(fn, items))
+
+    def read_files(self, swarm_hashes, as_type=None, verify_type=False, max_retries=3, backend=None, lazy=False):
+        return self._map_concurrently(
+            lambda swarm_hash: self._retry_throttled(
+                self.read_file, swarm_hash, as_type=as_type, verify_type=verify_type, max_retries=max_retries,
+                backend=backend, lazy=lazy
+            ),
+            swarm_hashes
+        )
+
+    @contextmanager
+    def _slot(self, slot=None):
+        # operations made of several concurrent requests hold one slot for all of them,
+        # so that their requests cannot wait for each other at the limiter
+        if slot is not None:
+            yield slot
+            return
+        with self.concurrency.slot() as slot:
+            yield slot
+
+    def _write_file_internal(self, content, file_name, mime_type, batch_id, size=None, slot=None):
+        if size is None:
+            size = len(content)
+        if self.batches is None:
+            return self._post_file(content, file_name, mime_type, batch_id, size, slot)
+        with self.batches.reserved(self, size, batch_id=batch_id) as reserved_batch_id:
+            return self._post_file(content, file_name, mime_type, reserved_batch_id, size, slot)
+
+    def _post_file(self, content, file_name, mime_type, batch_id, size, slot=None):
+        # streamed bodies of unknown length (see pipeline.py) apply the bandwidth limit
+        # and count their bytes as they are sent; size is then only an estimate
+        streamed = hasattr(content, 'bytes_sent')
+        if self.bandwidth_limit is not None and not streamed:
+            content = ThrottledBody(content, size, self.bandwidth_limit)
+
+        with self._slot(slot) as slot:
+            start = time.perf_counter()
+            try:
+                r = self.transport.request(
+                    'POST',
+                    '%s/bzz?file_name=%s' % (self.gateway_url, urllib.parse.quote(file_name)),
+                    data=content,
+                    headers={
+                        'swarm-postage-batch-id': batch_id or '0000000000000000000000000000000000000000000000000000000000000000',
+                        'Content-Type': mime_type
+                    }
+                )
+            except Exception:
+                self.instrumentation.on_request('write', self.gateway_url, None, 0, 0)
+                raise
+            connect_time = getattr(r, 'connect_time', None)
+            if connect_time is not None:
+                self.instrumentation.on_phase('write', 'connect', connect_time)
+            self.instrumentation.on_phase('write', 'transfer', time.perf_counter() - start)
+            self.instrumentation.on_request('write', self.gateway_url, r.status_code, len(r.content), content.bytes_sent if streamed else size)
+            if r.status_code in THROTTLE_STATUS_CODES:
+                slot.throttle()
+            elif r.status_code != 200 and r.status_code != 201:
+                slot.fail()
+
+        if r.status_code == BATCH_EXHAUSTED_STATUS_CODE and self.batches is not None:
+            self.batches.invalidate(batch_id)
+
+        if r.status_code != 200 and r.status_code != 201:
+            raise SwarmAPIError(
+                'File could not be uploaded to Swarm (code %d)' % r.status_code,
+                status_code=r.status_code,
+            )
+
+        try:
+            response = r.json()
+        except (json.JSONDecodeError, TypeError) as e:
+            raise SwarmAPIError(
+                'File could not be uploaded to Swarm'
+            ) from e
+
+        if 'reference' not in response:
+            raise SwarmAPIError('File could not be uploaded to Swarm (reference not found in API response)')
+
+        return response['reference']
+
+    def write_file(self, content, file_name=None, as_type=None, mime_type=None, batch_id=None):
+        if as_type == "text" and not isinstance(content, str):
+            raise SwarmTypeError(
+                "Text upload requested, but content is not of type 'str'.",
+                expected_type='str',
+                actual_type=type(content).__name__
+            )
+        if as_type == "bytes" and not isinstance(content, bytes) and not isinstance(content, bytearray):
+            raise SwarmTypeError(
+                "Byte upload requested, but content is not of type 'bytes'.",
+                expected_type='bytes',
+                actual_type=type(content).__name__
+            )
+        if as_type is None:
+            as_type = detect_upload_type(content)
+        start = time.perf_counter()
+        write_content, write_file_name, write_mime_type = encode(content, as_type, file_name=file_name, mime_type=mime_type)
+        self.instrumentation.on_phase('write', 'encode', time.perf_counter() - start)
+        return self._write_file_internal(write_content, write_file_name, write_mime_type, batch_id)
+
+    def write_files(self, contents, file_names=None, as_type=None, mime_type=None, batch_id=None, max_retries=3):
+        contents = list(contents)
+        if file_names is None:
+            file_names = [None] * len(contents)
+        elif len(file_names) != len(contents):
+            raise ValueError('Expected %d file names, got %d' % (len(contents), len(file_names)))
+        return self._map_concurrently(
+            lambda item: self._retry_throttled(
+                self.write_file, item[0], file_name=item[1], as_type=as_type, mime_type=mime_type, batch_id=batch_id,
+                max_retries=max_retries
+            ),
+            zip(contents, file_names)
+        )
+
+    def write_from_file(self, f, file_name, mime_type='application/octet-stream', batch_id=None):
+        # streams a binary file object opened for reading to Swarm without loading it into memory
+        size = os.fstat(f.fileno()).st_size - f.tell()
+        return self._write_file_internal(f, file_name, mime_type, batch_id, size=size)
+
+    def write_dataset(self, df, partition_by=None, append_to=None, batch_id=None, max_retries=3):
+        from .dataset import write_dataset
+        return write_dataset(self, df, partition_by=partition_by, append_to=append_to, batch_id=batch_id, max_retries=max_retries)
+
+    def read_dataset(self, manifest_hash, filters=None, columns=None, max_retries=3):
+        from .dataset import read_dataset
+        return read_dataset(self, manifest_hash, filters=filters, columns=columns, max_retries=max_retries)
+
+    def transform(self, source_hash, fn, as_type=None, out_type=None, file_name=None, batch_id=None, backend=None, size_hint=None):
+        from .pipeline import transform
+        return transform(
+            self, source_hash, fn, as_type=as_type, out_type=out_type, file_name=file_name, batch_id=batch_id, backend=backend,
+            size_hint=size_hint
+        )
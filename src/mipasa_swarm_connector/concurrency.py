@@ -0,0 +1,158 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _Slot:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latency = None
+        self.throttled = False
+        self.failed = False
+
+    def observe_latency(self, seconds):
+        self.latency = seconds
+
+    def throttle(self):
+        self.throttled = True
+
+    def fail(self):
+        self.failed = True
+
+
+class AdaptiveLimiter:
+    # AIMD limit on the number of requests in flight: the limit grows by roughly one
+    # per limit's worth of successful requests while latency stays within `tolerance`
+    # times the observed baseline, and is multiplied by `backoff` on throttling or
+    # latency spikes. Requests that started before a decrease cannot decrease it again,
+    # so one congestion event only backs off once.
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, backoff=0.5, tolerance=2.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self.baseline_latency = None
+        self._last_decrease = float('-inf')
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return "<AdaptiveLimiter limit=%.2f in_flight=%d>" % (self.limit, self.in_flight)
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return _Slot()
+
+    def release(self, slot, success=True):
+        with self._condition:
+            self.in_flight -= 1
+            if slot.throttled:
+                self._decrease(slot)
+            elif success and not slot.failed:
+                if slot.latency is not None and self._is_latency_spike(slot.latency):
+                    self._decrease(slot)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        slot = self.acquire()
+        success = False
+        try:
+            yield slot
+            success = True
+        finally:
+            self.release(slot, success=success)
+
+    def _is_latency_spike(self, latency):
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+            return False
+        spike = latency > self.baseline_latency * self.tolerance
+        # let the baseline follow slowly so that a lasting change in conditions is relearned
+        self.baseline_latency += (latency - self.baseline_latency) * 0.05
+        return spike
+
+    def _decrease(self, slot):
+        if slot.started < self._last_decrease:
+            return
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self._last_decrease = time.monotonic()
+
+
+class TokenBucket:
+    # Limits throughput to `rate` bytes per second with bursts of up to `burst` bytes.
+    # Callers consuming more than is available go into debt and sleep it off, so
+    # transfers larger than the burst size are still allowed.
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('Rate must be positive (got %r)' % rate)
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<TokenBucket rate=%g>" % self.rate
+
+    def consume(self, amount):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class ThrottledBody:
+    # Request body of known length which is sent in chunks, consuming the bucket's
+    # tokens as it goes, so the limit applies to the transfer itself.
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, content, size, bucket, chunk_size=CHUNK_SIZE):
+        self.content = content
+        self.size = size
+        self.bucket = bucket
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        if hasattr(self.content, 'read'):
+            chunks = iter(lambda: self.content.read(self.chunk_size), b'')
+        else:
+            view = memoryview(self.content)
+            chunks = (view[offset:offset + self.chunk_size] for offset in range(0, len(view), self.chunk_size))
+        for chunk in chunks:
+            self.bucket.consume(len(chunk))
+            yield bytes(chunk)
@@ -0,0 +1,294 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import datetime
+from io import BytesIO
+from .errors import SwarmTypeError
+from .formats import load_optional_pandas, check_optional_parquet
+
+MANIFEST_FORMAT = 'mipasa-swarm-dataset'
+MANIFEST_VERSION = 1
+
+FILTER_OPERATORS = ['=', '==', '!=', '<', '<=', '>', '>=', 'in', 'not in']
+
+
+def _json_scalar(value):
+    # converts a pandas/numpy scalar to a JSON-compatible value, or raises TypeError
+    try:
+        if value is None or value != value:
+            return None
+    except TypeError:
+        # pandas.NA cannot be used in a boolean context
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    raise TypeError('Value %r is not JSON serializable' % (value,))
+
+
+def _column_statistics(series):
+    non_null = series.dropna()
+    stats = {'null_count': int(len(series) - len(non_null))}
+    if len(non_null):
+        try:
+            stats['min'] = _json_scalar(non_null.min())
+            stats['max'] = _json_scalar(non_null.max())
+        except TypeError:
+            # mixed or unorderable values, no range can be recorded
+            pass
+    else:
+        stats['min'] = None
+        stats['max'] = None
+    return stats
+
+
+def _column_kinds(df):
+    # columns whose statistics and partition values are stored as ISO strings
+    pd = load_optional_pandas()
+    return dict((str(c), 'datetime') for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c]))
+
+
+def _partition_entry(df, partition_by, values):
+    return {
+        'values': dict(zip(partition_by, [_json_scalar(v) for v in values])),
+        'num_rows': int(len(df)),
+        'statistics': dict((str(c), _column_statistics(df[c])) for c in df.columns),
+    }
+
+
+def read_manifest(conn, manifest_hash):
+    manifest = conn.read_file(manifest_hash, as_type='json')
+    if not isinstance(manifest, dict) or manifest.get('format') != MANIFEST_FORMAT:
+        raise SwarmTypeError(
+            'Hash %s is not a dataset manifest' % repr(manifest_hash),
+            swarm_hash=manifest_hash,
+            expected_type='dataset',
+            actual_type='json'
+        )
+    return manifest
+
+
+def write_dataset(conn, df, partition_by=None, append_to=None, batch_id=None, max_retries=3):
+    pd = load_optional_pandas()
+    check_optional_parquet()
+    if not isinstance(df, pd.DataFrame):
+        raise SwarmTypeError(
+            "Dataset upload requested, but content is not of type 'DataFrame'.",
+            expected_type='DataFrame',
+            actual_type=type(df).__name__
+        )
+    if isinstance(partition_by, str):
+        partition_by = [partition_by]
+
+    if append_to is not None:
+        manifest = read_manifest(conn, append_to)
+        if partition_by is None:
+            partition_by = manifest['partition_by']
+        elif list(partition_by) != manifest['partition_by']:
+            raise ValueError('Dataset is partitioned by %r, cannot append partitions by %r' % (manifest['partition_by'], list(partition_by)))
+    else:
+        manifest = {
+            'format': MANIFEST_FORMAT,
+            'version': MANIFEST_VERSION,
+            'partition_by': list(partition_by or []),
+            'columns': [],
+            'column_kinds': {},
+            'partitions': [],
+        }
+    partition_by = manifest['partition_by']
+
+    missing = [c for c in partition_by if c not in df.columns]
+    if missing:
+        raise ValueError('Partition columns %r not found in DataFrame' % missing)
+
+    if partition_by:
+        groups = [
+            (key if isinstance(key, tuple) else (key,), group.reset_index(drop=True))
+            for key, group in df.groupby(partition_by if len(partition_by) > 1 else partition_by[0], sort=True, dropna=False)
+        ]
+    else:
+        groups = [((), df.reset_index(drop=True))]
+
+    first_index = len(manifest['partitions'])
+    file_names = ['part-%05d.parquet' % (first_index + i) for i in range(len(groups))]
+    references = conn.write_files(
+        [group for _, group in groups],
+        file_names=file_names,
+        as_type='parquet',
+        batch_id=batch_id,
+        max_retries=max_retries
+    )
+
+    for (values, group), file_name, reference in zip(groups, file_names, references):
+        entry = _partition_entry(group, partition_by, values)
+        entry['reference'] = reference
+        entry['file_name'] = file_name
+        manifest['partitions'].append(entry)
+    for c in df.columns:
+        if str(c) not in manifest['columns']:
+            manifest['columns'].append(str(c))
+    # manifests written before column kinds were recorded have none
+    manifest.setdefault('column_kinds', {}).update(_column_kinds(df))
+
+    return conn.write_file(manifest, file_name='manifest.json', as_type='json', batch_id=batch_id)
+
+
+def _normalize_filters(filters):
+    # returns filters in disjunctive normal form: a list of conjunctions of (column, op, value)
+    if not filters:
+        return []
+    if all(isinstance(f, tuple) for f in filters):
+        filters = [filters]
+    result = []
+    for conjunction in filters:
+        clauses = []
+        for column, op, value in conjunction:
+            if op not in FILTER_OPERATORS:
+                raise ValueError('Unsupported filter operator %r (expected one of %s)' % (op, ', '.join(map(repr, FILTER_OPERATORS))))
+            clauses.append((column, '==' if op == '=' else op, value))
+        result.append(clauses)
+    return result
+
+
+def _coerce(stat, value, kind=None):
+    # statistics of datetime columns are stored as ISO strings; they are compared as timestamps,
+    # like pandas compares the column, whether the filter value is a date or a string
+    if isinstance(stat, str) and (kind == 'datetime' or isinstance(value, (datetime.date, datetime.datetime))):
+        pd = load_optional_pandas()
+        return pd.Timestamp(stat), pd.Timestamp(value)
+    return stat, value
+
+
+def _range_may_match(op, lo, hi, value, kind=None):
+    if lo is None or hi is None:
+        # only nulls; they never satisfy comparisons
+        return op in ('!=', 'not in')
+    if op == 'in':
+        return any(_range_may_match('==', lo, hi, v, kind) for v in value)
+    if op == 'not in':
+        return all(_range_may_match('!=', lo, hi, v, kind) for v in value)
+    lo, v = _coerce(lo, value, kind)
+    hi, _ = _coerce(hi, value, kind)
+    if op == '==':
+        return lo <= v <= hi
+    if op == '!=':
+        return not (lo == hi == v)
+    if op == '<':
+        return lo < v
+    if op == '<=':
+        return lo <= v
+    if op == '>':
+        return hi > v
+    return hi >= v
+
+
+def _clause_may_match(partition, column, op, value, kind=None):
+    stats = partition['statistics'].get(column)
+    if column in partition['values']:
+        v = partition['values'][column]
+        lo, hi = v, v
+    elif stats is not None and 'min' in stats:
+        lo, hi = stats['min'], stats['max']
+    else:
+        return True
+    if op in ('!=', 'not in') and stats is not None and stats.get('null_count'):
+        # nulls are not equal to anything, so such partitions always have matching rows
+        return True
+    try:
+        return _range_may_match(op, lo, hi, value, kind)
+    except (TypeError, ValueError):
+        # values which cannot be compared with the statistics never prune
+        return True
+
+
+def prune_partitions(manifest, filters):
+    filters = _normalize_filters(filters)
+    if not filters:
+        return list(manifest['partitions'])
+    kinds = manifest.get('column_kinds', {})
+    return [
+        p for p in manifest['partitions']
+        if any(
+            all(_clause_may_match(p, column, op, value, kinds.get(column)) for column, op, value in conjunction)
+            for conjunction in filters
+        )
+    ]
+
+
+def _isin_values(series, values):
+    # isin does not parse strings like the comparison operators do
+    pd = load_optional_pandas()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.to_datetime(list(values))
+    return values
+
+
+def _filter_mask(df, filters):
+    mask = None
+    for conjunction in filters:
+        conjunction_mask = None
+        for column, op, value in conjunction:
+            series = df[column]
+            if op == '==':
+                m = series == value
+            elif op == '!=':
+                m = series != value
+            elif op == '<':
+                m = series < value
+            elif op == '<=':
+                m = series <= value
+            elif op == '>':
+                m = series > value
+            elif op == '>=':
+                m = series >= value
+            elif op == 'in':
+                m = series.isin(_isin_values(series, value))
+            else:
+                m = ~series.isin(_isin_values(series, value))
+            conjunction_mask = m if conjunction_mask is None else conjunction_mask & m
+        mask = conjunction_mask if mask is None else mask | conjunction_mask
+    return mask
+
+
+def read_dataset(conn, manifest_hash, filters=None, columns=None, max_retries=3):
+    pd = load_optional_pandas()
+    check_optional_parquet()
+    manifest = read_manifest(conn, manifest_hash)
+    partitions = prune_partitions(manifest, filters)
+    filters = _normalize_filters(filters)
+
+    read_columns = None
+    if columns is not None:
+        filter_columns = [c for conjunction in filters for c, _, _ in conjunction]
+        read_columns = list(columns) + [c for c in dict.fromkeys(filter_columns) if c not in columns]
+
+    def load(partition):
+        content, _ = conn._retry_throttled(conn._read_file_internal, partition['reference'], max_retries=max_retries)
+        df = pd.read_parquet(BytesIO(content), columns=read_columns)
+        if filters:
+            df = df[_filter_mask(df, filters)]
+        if columns is not None:
+            df = df[list(columns)]
+        return df
+
+    frames = conn._map_concurrently(load, partitions)
+    if not frames:
+        return pd.DataFrame(columns=list(columns if columns is not None else manifest['columns']))
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,97 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import os
+from .formats import frame_backend
+
+
+def _split_params(line):
+    # splits on semicolons which are not inside a quoted string
+    parts = []
+    current = []
+    quoted = False
+    escaped = False
+    for ch in line:
+        if escaped:
+            escaped = False
+        elif ch == '\\' and quoted:
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == ';' and not quoted:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append(''.join(current))
+    return parts
+
+
+def parse_header(line):
+    # replacement for cgi.parse_header, which was removed in Python 3.13
+    parts = _split_params(line)
+    value = parts[0].strip().lower()
+    params = {}
+    for part in parts[1:]:
+        if '=' not in part:
+            continue
+        key, param = part.split('=', 1)
+        key = key.strip().lower()
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = param[1:-1].replace('\\\\', '\\').replace('\\"', '"')
+        params[key] = param
+    return value, params
+
+
+def detect_type(headers):
+    if "Content-Type" in headers:
+        t, _ = parse_header(headers["Content-Type"])
+        if t == "text/plain":
+            return "text"
+        elif t == "text/csv":
+            return "csv"
+        elif t == "application/json":
+            return "json"
+        elif t == "application/vnd.apache.parquet" or t == "application/parquet":
+            return "parquet"
+
+    if "Content-Disposition" in headers:
+        _, params = parse_header(headers["Content-Disposition"])
+        if "filename" in params:
+            _, ext = os.path.splitext(params["filename"])
+            ext = ext.lower()
+            if ext == ".txt":
+                return "text"
+            elif ext == ".csv":
+                return "csv"
+            elif ext == ".json":
+                return "json"
+            elif ext == ".parquet":
+                return "parquet"
+
+    return "bytes"
+
+
+def detect_upload_type(content):
+    if isinstance(content, str):
+        return 'text'
+    if isinstance(content, bytes):
+        return 'bytes'
+    if frame_backend(content) is not None:
+        return 'csv'
+    return 'json'
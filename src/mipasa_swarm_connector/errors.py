@@ -0,0 +1,46 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+class SwarmError(Exception):
+    def __init__(self, msg, swarm_hash=None):
+        super().__init__(msg)
+        self.swarm_hash = swarm_hash
+
+
+class SwarmClientError(SwarmError):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+
+class SwarmAPIError(SwarmError):
+    def __init__(self, msg, swarm_hash=None, status_code=None):
+        super().__init__(msg, swarm_hash=swarm_hash)
+        self.status_code = status_code
+
+
+class SwarmTypeError(SwarmError, TypeError):
+    def __init__(self, msg, swarm_hash=None, expected_type=None, actual_type=None):
+        super().__init__(msg, swarm_hash=swarm_hash)
+        self.expected_type = expected_type
+        self.actual_type = actual_type
+
+
+class SwarmBatchError(SwarmError):
+    def __init__(self, msg, batch_id=None, required_chunks=None):
+        super().__init__(msg)
+        self.batch_id = batch_id
+        self.required_chunks = required_chunks
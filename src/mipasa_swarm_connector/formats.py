@@ -0,0 +1,194 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import json
+import sys
+from io import BytesIO
+from .errors import SwarmTypeError
+
+
+BACKENDS = ['pandas', 'polars', 'arrow']
+
+
+def load_optional_pandas():
+    try:
+        import pandas as pd
+        return pd
+    except ImportError as e:
+        raise ImportError('Pandas is not installed, but required for read_csv and read_parquet functions.') from e
+
+
+def load_optional_polars():
+    try:
+        import polars as pl
+        return pl
+    except ImportError as e:
+        raise ImportError('Polars is not installed, but required for the polars backend.') from e
+
+
+def load_optional_pyarrow():
+    try:
+        import pyarrow as pa
+        return pa
+    except ImportError as e:
+        raise ImportError('PyArrow is not installed, but required for the arrow backend.') from e
+
+
+def check_backend(backend, lazy=False):
+    if backend not in BACKENDS:
+        raise ValueError('Unsupported backend %s (expected one of %s)' % (repr(backend), ', '.join(map(repr, BACKENDS))))
+    if lazy and backend != 'polars':
+        raise ValueError('Lazy reads are only supported by the polars backend')
+
+
+def check_optional_parquet():
+    try:
+        import pyarrow
+    except ImportError:
+        try:
+            import fastparquet
+        except ImportError as e:
+            raise ImportError('Neither PyArrow or FastParquet are installed, but required for read_parquet function.') from e
+
+
+def _decode_polars(content, data_type, lazy):
+    pl = load_optional_polars()
+    # polars reads bytes, but not arbitrary buffers such as mapped cache entries; the cache
+    # file itself cannot be scanned either, as it may be evicted before a LazyFrame is collected
+    source = content if isinstance(content, bytes) else bytes(content)
+    if data_type == "csv":
+        return pl.scan_csv(source) if lazy else pl.read_csv(source)
+    return pl.scan_parquet(source) if lazy else pl.read_parquet(source)
+
+
+def _decode_arrow(content, data_type):
+    pa = load_optional_pyarrow()
+    buffer = pa.BufferReader(pa.py_buffer(content))
+    if data_type == "csv":
+        import pyarrow.csv
+        return pyarrow.csv.read_csv(buffer)
+    import pyarrow.parquet
+    return pyarrow.parquet.read_table(buffer)
+
+
+def decode(content, data_type, backend='pandas', lazy=False):
+    if data_type in ("csv", "parquet") and backend == "polars":
+        return _decode_polars(content, data_type, lazy)
+    if data_type in ("csv", "parquet") and backend == "arrow":
+        return _decode_arrow(content, data_type)
+    if data_type == "csv":
+        pd = load_optional_pandas()
+        f = BytesIO(content)
+        return pd.read_csv(f)
+    elif data_type == "parquet":
+        pd = load_optional_pandas()
+        check_optional_parquet()
+        f = BytesIO(content)
+        return pd.read_parquet(f)
+    elif data_type == "json":
+        f = BytesIO(content)
+        return json.load(f)
+    else:
+        return bytes(content)
+
+
+def frame_backend(content):
+    # returns the backend a DataFrame-like object belongs to, or None;
+    # only libraries which have already been imported can have produced it
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(content, pd.DataFrame):
+        return 'pandas'
+    pl = sys.modules.get('polars')
+    if pl is not None and isinstance(content, (pl.DataFrame, pl.LazyFrame)):
+        return 'polars'
+    pa = sys.modules.get('pyarrow')
+    if pa is not None and isinstance(content, (pa.Table, pa.RecordBatch)):
+        return 'arrow'
+    return None
+
+
+def _encode_frame(content, as_type, backend):
+    bio = BytesIO()
+    if backend == 'polars':
+        if isinstance(content, sys.modules['polars'].LazyFrame):
+            content = content.collect()
+        if as_type == 'csv':
+            content.write_csv(bio)
+        else:
+            content.write_parquet(bio)
+    elif as_type == 'csv':
+        import pyarrow.csv
+        pyarrow.csv.write_csv(content, bio)
+    else:
+        import pyarrow
+        import pyarrow.parquet
+        if isinstance(content, pyarrow.RecordBatch):
+            content = pyarrow.Table.from_batches([content])
+        pyarrow.parquet.write_table(content, bio)
+    return bio.getvalue()
+
+
+def encode(content, as_type, file_name=None, mime_type=None):
+    if as_type == 'bytes':
+        write_content = content
+        write_file_name = file_name or 'file.bin'
+        write_mime_type = mime_type or 'application/octet-stream'
+    elif as_type in ('csv', 'parquet') and frame_backend(content) in ('polars', 'arrow'):
+        write_content = _encode_frame(content, as_type, frame_backend(content))
+        write_file_name = file_name or 'file.%s' % as_type
+        write_mime_type = mime_type or ('text/csv' if as_type == 'csv' else 'application/vnd.apache.parquet')
+    elif as_type == 'csv':
+        pd = load_optional_pandas()
+        if not isinstance(content, pd.DataFrame):
+            raise SwarmTypeError(
+                "CSV upload requested, but content is not of type 'DataFrame'.",
+                expected_type='DataFrame',
+                actual_type=type(content).__name__
+            )
+        write_content = content.to_csv(index=False).encode('utf-8')
+        write_file_name = file_name or 'file.csv'
+        write_mime_type = mime_type or 'text/csv'
+    elif as_type == 'parquet':
+        pd = load_optional_pandas()
+        check_optional_parquet()
+        if not isinstance(content, pd.DataFrame):
+            raise SwarmTypeError(
+                "Parquet upload requested, but content is not of type 'DataFrame'.",
+                expected_type='DataFrame',
+                actual_type=type(content).__name__
+            )
+        bio = BytesIO()
+        bio_close = bio.close
+        bio.close = lambda: None
+        try:
+            content.to_parquet(bio)
+        finally:
+            bio.close = bio_close
+        bio.seek(0)
+        write_content = bio.read()
+        write_file_name = file_name or 'file.parquet'
+        write_mime_type = mime_type or 'application/vnd.apache.parquet'
+    elif as_type == 'json':
+        try:
+            write_content = json.dumps(content).encode('utf-8')
+        except TypeError as e:
+            raise SwarmTypeError("JSON upload requested, but content is not JSON serializable.") from e
+        write_file_name = file_name or 'file.json'
+        write_mime_type = mime_type or 'application/json'
+    else:
+        raise SwarmTypeError("Unsupported upload type '%s'" % as_type)
+    return write_content, write_file_name, write_mime_type
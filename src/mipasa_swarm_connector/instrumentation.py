@@ -0,0 +1,153 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import bisect
+import threading
+from collections import defaultdict
+
+
+class Instrumentation:
+    # Subclass and override the callbacks of interest; the base class ignores all events.
+    # operation is 'read' or 'write'; phase is one of 'connect', 'ttfb', 'transfer', 'decode', 'encode'.
+    # 'connect' is only reported by transports which measure connection setup separately.
+
+    def on_phase(self, operation, phase, seconds):
+        pass
+
+    def on_request(self, operation, gateway_url, status_code, bytes_in, bytes_out):
+        pass
+
+    def on_cache(self, operation, hit):
+        pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        total = 0
+        result = []
+        for c in self.counts:
+            total += c
+            result.append(total)
+        return result
+
+    def quantile(self, q):
+        # upper bound of the bucket containing the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        for upper, total in zip(self.buckets + (float('inf'),), self.cumulative_counts()):
+            if total >= rank:
+                return upper
+        return float('inf')
+
+
+class MetricsCollector(Instrumentation):
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets=None, prefix='mipasa_swarm'):
+        self.buckets = tuple(buckets or self.DEFAULT_BUCKETS)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        return "<MetricsCollector>"
+
+    def reset(self):
+        with self._lock:
+            self.phases = {}
+            self.bytes = defaultdict(int)
+            self.responses = defaultdict(int)
+            self.cache = defaultdict(int)
+
+    def on_phase(self, operation, phase, seconds):
+        with self._lock:
+            key = (operation, phase)
+            if key not in self.phases:
+                self.phases[key] = Histogram(self.buckets)
+            self.phases[key].observe(seconds)
+
+    def on_request(self, operation, gateway_url, status_code, bytes_in, bytes_out):
+        with self._lock:
+            self.bytes[(operation, 'in')] += bytes_in
+            self.bytes[(operation, 'out')] += bytes_out
+            status = 'error' if status_code is None else str(status_code)
+            self.responses[(gateway_url, operation, status)] += 1
+
+    def on_cache(self, operation, hit):
+        with self._lock:
+            self.cache[(operation, 'hit' if hit else 'miss')] += 1
+
+    def cache_hit_rate(self, operation='read'):
+        hits = self.cache.get((operation, 'hit'), 0)
+        total = hits + self.cache.get((operation, 'miss'), 0)
+        if not total:
+            return None
+        return hits / total
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @classmethod
+    def _labels(cls, **labels):
+        return '{%s}' % ','.join('%s="%s"' % (k, cls._escape(v)) for k, v in labels.items())
+
+    @staticmethod
+    def _format_bound(value):
+        return '+Inf' if value == float('inf') else repr(float(value))
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            name = '%s_phase_seconds' % self.prefix
+            lines.append('# HELP %s Duration of request phases in seconds.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for (operation, phase), h in sorted(self.phases.items()):
+                for upper, total in zip(h.buckets + (float('inf'),), h.cumulative_counts()):
+                    lines.append('%s_bucket%s %d' % (name, self._labels(operation=operation, phase=phase, le=self._format_bound(upper)), total))
+                lines.append('%s_sum%s %r' % (name, self._labels(operation=operation, phase=phase), h.sum))
+                lines.append('%s_count%s %d' % (name, self._labels(operation=operation, phase=phase), h.count))
+
+            name = '%s_bytes_total' % self.prefix
+            lines.append('# HELP %s Bytes transferred to and from the gateway.' % name)
+            lines.append('# TYPE %s counter' % name)
+            for (operation, direction), value in sorted(self.bytes.items()):
+                lines.append('%s%s %d' % (name, self._labels(operation=operation, direction=direction), value))
+
+            name = '%s_responses_total' % self.prefix
+            lines.append('# HELP %s Gateway responses by status code.' % name)
+            lines.append('# TYPE %s counter' % name)
+            for (gateway_url, operation, status), value in sorted(self.responses.items()):
+                lines.append('%s%s %d' % (name, self._labels(gateway=gateway_url, operation=operation, status=status), value))
+
+            name = '%s_cache_lookups_total' % self.prefix
+            lines.append('# HELP %s Cache lookups by result.' % name)
+            lines.append('# TYPE %s counter' % name)
+            for (operation, result), value in sorted(self.cache.items()):
+                lines.append('%s%s %d' % (name, self._labels(operation=operation, result=result), value))
+        return '\n'.join(lines) + '\n'
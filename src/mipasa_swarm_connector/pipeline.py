@@ -0,0 +1,367 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import io
+import queue
+import sys
+import tempfile
+import threading
+import time
+from .detection import detect_type
+from .errors import SwarmTypeError
+from .formats import check_backend, frame_backend, load_optional_pyarrow
+
+
+STREAM_TYPES = ['csv', 'parquet']
+
+MIME_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+# chunks buffered between the download, transform and upload stages
+MAX_BUFFERED_CHUNKS = 8
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class _End:
+    def __init__(self, error=None):
+        self.error = error
+
+
+class _Channel:
+    # bounded queue of byte chunks between two threads; the producer ends it with close(),
+    # the consumer gives up with cancel(), which makes further puts raise _Cancelled
+
+    def __init__(self, max_chunks):
+        self._queue = queue.Queue(max_chunks)
+        self._cancelled = threading.Event()
+
+    def put(self, item):
+        while True:
+            if self._cancelled.is_set():
+                raise _Cancelled()
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self, error=None):
+        try:
+            self.put(_End(error))
+        except _Cancelled:
+            pass
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, _End):
+                if item.error is not None:
+                    raise item.error
+                return
+            yield item
+
+
+class _ChannelReader(io.RawIOBase):
+    def __init__(self, channel):
+        self._chunks = iter(channel)
+        self._buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class _ChannelWriter(io.RawIOBase):
+    # coalesces the encoder's small writes into chunks; finish() ends the channel
+    def __init__(self, channel, chunk_size):
+        self._channel = channel
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer += b
+        while len(self._buffer) >= self._chunk_size:
+            self._channel.put(bytes(self._buffer[:self._chunk_size]))
+            del self._buffer[:self._chunk_size]
+        return len(b)
+
+    def finish(self):
+        if self._buffer:
+            self._channel.put(bytes(self._buffer))
+            self._buffer = bytearray()
+        self._channel.close()
+
+
+class _StreamBody:
+    # request body of unknown length; see SwarmConnection._write_file_internal
+    def __init__(self, channel, bandwidth_limit):
+        self._channel = channel
+        self._bandwidth_limit = bandwidth_limit
+        self.bytes_sent = 0
+
+    def __iter__(self):
+        for chunk in self._channel:
+            if self._bandwidth_limit is not None:
+                self._bandwidth_limit.consume(len(chunk))
+            self.bytes_sent += len(chunk)
+            yield chunk
+
+
+def _download(conn, swarm_hash, slot, channel, chunk_size, info, ready):
+    # produces the source file into the channel; info receives its data type and size
+    try:
+        cached = None
+        if conn.cache is not None:
+            cached = conn.cache.get(swarm_hash)
+            conn.instrumentation.on_cache('read', cached is not None)
+        if cached is not None:
+            view, info['data_type'] = cached
+            info['size'] = len(view)
+            ready.set()
+            for offset in range(0, len(view), chunk_size):
+                channel.put(bytes(view[offset:offset + chunk_size]))
+        else:
+            r, headers_received = conn._request_read(swarm_hash, slot)
+            info['data_type'] = detect_type(r.headers)
+            info['size'] = int(r.headers.get('Content-Length') or 0)
+            ready.set()
+            received = 0
+            try:
+                for chunk in r.iter_content(chunk_size):
+                    channel.put(chunk)
+                    received += len(chunk)
+                    if conn.bandwidth_limit is not None:
+                        conn.bandwidth_limit.consume(len(chunk))
+            finally:
+                r.close()
+            conn.instrumentation.on_phase('read', 'transfer', time.perf_counter() - headers_received)
+            conn.instrumentation.on_request('read', conn.gateway_url, r.status_code, received, 0)
+    except _Cancelled:
+        pass
+    except BaseException as e:
+        info['error'] = e
+        channel.close(e)
+    else:
+        channel.close()
+    finally:
+        ready.set()
+
+
+def _record_batches(source, as_type):
+    if as_type == 'csv':
+        import pyarrow.csv
+        yield from pyarrow.csv.open_csv(_ChannelReader(source))
+        return
+    # the Parquet footer comes last, so the file is spooled to disk before it can be decoded
+    import pyarrow.parquet
+    with tempfile.TemporaryFile() as f:
+        for chunk in source:
+            f.write(chunk)
+        f.seek(0)
+        yield from pyarrow.parquet.ParquetFile(f).iter_batches()
+
+
+def _to_backend(batch, backend):
+    if backend == 'pandas':
+        return batch.to_pandas()
+    if backend == 'polars':
+        import polars as pl
+        return pl.from_arrow(batch)
+    return batch
+
+
+def _to_arrow(result):
+    import pyarrow as pa
+    backend = frame_backend(result)
+    if backend == 'pandas':
+        return pa.Table.from_pandas(result, preserve_index=False)
+    if backend == 'polars':
+        if isinstance(result, sys.modules['polars'].LazyFrame):
+            result = result.collect()
+        return result.to_arrow()
+    if isinstance(result, pa.RecordBatch):
+        return pa.Table.from_batches([result])
+    if backend == 'arrow':
+        return result
+    raise SwarmTypeError(
+        'Transform function must return a DataFrame, a Table, a RecordBatch or None.',
+        expected_type='DataFrame',
+        actual_type=type(result).__name__
+    )
+
+
+def _open_writer(sink, out_type, schema):
+    if out_type == 'csv':
+        import pyarrow.csv
+        return pyarrow.csv.CSVWriter(sink, schema)
+    import pyarrow.parquet
+    return pyarrow.parquet.ParquetWriter(sink, schema)
+
+
+def _run_transform(conn, source, output, fn, as_type, out_type, backend, chunk_size):
+    sink = _ChannelWriter(output, chunk_size)
+    writer = None
+    schema = None
+    out_schema = None
+    empty_schema = None
+    decode_time = encode_time = 0.0
+    batches = _record_batches(source, as_type)
+    while True:
+        start = time.perf_counter()
+        batch = next(batches, None)
+        decode_time += time.perf_counter() - start
+        if batch is None:
+            break
+        schema = batch.schema
+        result = fn(_to_backend(batch, backend))
+        if result is None:
+            continue
+        start = time.perf_counter()
+        table = _to_arrow(result)
+        if writer is None and table.num_rows == 0:
+            # empty results lose column types (an empty object column becomes null),
+            # so the writer takes its schema from the first rows
+            if empty_schema is None:
+                empty_schema = table.schema
+        else:
+            if writer is None:
+                out_schema = table.schema
+                writer = _open_writer(sink, out_type, out_schema)
+            elif not table.schema.equals(out_schema):
+                table = table.cast(out_schema)
+            writer.write_table(table)
+        encode_time += time.perf_counter() - start
+    start = time.perf_counter()
+    if writer is None:
+        # no rows were kept: publish an empty file with the result columns, or those of the source
+        import pyarrow as pa
+        if empty_schema is None:
+            empty_schema = schema if schema is not None else pa.schema([])
+        writer = _open_writer(sink, out_type, empty_schema)
+    writer.close()
+    sink.finish()
+    encode_time += time.perf_counter() - start
+    conn.instrumentation.on_phase('read', 'decode', decode_time)
+    conn.instrumentation.on_phase('write', 'encode', encode_time)
+
+
+def transform(conn, source_hash, fn, as_type=None, out_type=None, file_name=None, batch_id=None, backend=None,
+              size_hint=None, chunk_size=CHUNK_SIZE, max_buffered_chunks=MAX_BUFFERED_CHUNKS):
+    # Downloads, transforms and uploads concurrently: fn receives the source one record batch
+    # at a time and returns the rows to publish (or None to drop the batch). Returns the new reference.
+    # size_hint is the expected output size used to pick a postage batch (by default the source size).
+    load_optional_pyarrow()
+    if backend is None:
+        backend = conn.backend
+    check_backend(backend)
+    for t in (as_type, out_type):
+        if t is not None and t not in STREAM_TYPES:
+            raise ValueError('Unsupported type %s (expected one of %s)' % (repr(t), ', '.join(map(repr, STREAM_TYPES))))
+
+    # the download and the upload run at the same time and wait for each other through the
+    # bounded channels, so they share one limiter slot rather than each waiting for their own
+    with conn.concurrency.slot() as slot:
+        return _transform(
+            conn, slot, source_hash, fn, as_type, out_type, file_name, batch_id, backend, size_hint,
+            chunk_size, max_buffered_chunks
+        )
+
+
+def _transform(conn, slot, source_hash, fn, as_type, out_type, file_name, batch_id, backend, size_hint,
+               chunk_size, max_buffered_chunks):
+    source = _Channel(max_buffered_chunks)
+    output = _Channel(max_buffered_chunks)
+    info = {}
+    ready = threading.Event()
+    downloader = threading.Thread(
+        target=_download, args=(conn, source_hash, slot, source, chunk_size, info, ready), daemon=True
+    )
+    downloader.start()
+    ready.wait()
+    if 'error' in info:
+        raise info['error']
+
+    if as_type is None:
+        as_type = info['data_type']
+        if as_type not in STREAM_TYPES:
+            source.cancel()
+            raise SwarmTypeError(
+                'Hash %s is of type %s, which cannot be transformed as a stream' % (repr(source_hash), repr(as_type)),
+                swarm_hash=source_hash,
+                expected_type=' or '.join(STREAM_TYPES),
+                actual_type=as_type
+            )
+    if out_type is None:
+        out_type = as_type
+
+    result = {}
+
+    def upload():
+        body = _StreamBody(output, conn.bandwidth_limit)
+        try:
+            # the output size is unknown until the upload ends, so the batch is chosen for an estimate;
+            # an output much larger than it can still exhaust the batch during the upload
+            size = size_hint if size_hint is not None else info.get('size', 0)
+            result['reference'] = conn._write_file_internal(
+                body, file_name or 'file.%s' % out_type, MIME_TYPES[out_type], batch_id, size=size, slot=slot
+            )
+        except BaseException as e:
+            result['error'] = e
+        finally:
+            # stops the transform if the upload ended before consuming all of it
+            output.cancel()
+
+    uploader = threading.Thread(target=upload, daemon=True)
+    uploader.start()
+    try:
+        _run_transform(conn, source, output, fn, as_type, out_type, backend, chunk_size)
+    except _Cancelled:
+        # the upload failed; its error is raised below
+        pass
+    except BaseException as e:
+        # aborts the upload request instead of publishing a truncated file
+        output.close(e)
+        uploader.join()
+        raise
+    finally:
+        source.cancel()
+    uploader.join()
+    if 'error' in result:
+        raise result['error']
+    return result['reference']
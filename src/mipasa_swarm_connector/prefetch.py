@@ -0,0 +1,142 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import heapq
+import itertools
+import json
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+
+class Prefetcher:
+    # Downloads references into the connection's cache on a fixed number of background
+    # threads. Pending downloads run in order of descending priority; submitting a
+    # reference that is already pending or in flight returns the existing future.
+
+    def __init__(self, conn, max_workers=4):
+        self.conn = conn
+        self.max_workers = max_workers
+        self._queue = []
+        self._pending = {}
+        self._running = set()
+        self._counter = itertools.count()
+        self._workers = []
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return "<Prefetcher pending=%d>" % len(self._pending)
+
+    def submit(self, swarm_hash, priority=0):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Cannot prefetch after the connection has been closed')
+            future = self._pending.get(swarm_hash)
+            if future is None or future.cancelled():
+                future = Future()
+                if swarm_hash in self.conn.cache:
+                    future.set_result(None)
+                    return future
+                self._pending[swarm_hash] = future
+            if swarm_hash not in self._running:
+                # a repeated submission with a higher priority overtakes the earlier queue entry
+                heapq.heappush(self._queue, (-priority, next(self._counter), swarm_hash))
+                self._start_worker()
+                self._condition.notify()
+            return future
+
+    def in_flight(self, swarm_hash):
+        return self._pending.get(swarm_hash)
+
+    def _start_worker(self):
+        if len(self._workers) < min(self.max_workers, len(self._pending)):
+            worker = threading.Thread(target=self._work, name='swarm-prefetch', daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next(self):
+        with self._condition:
+            while True:
+                while self._queue:
+                    _, _, swarm_hash = heapq.heappop(self._queue)
+                    if swarm_hash in self._pending and swarm_hash not in self._running:
+                        future = self._pending[swarm_hash]
+                        if not future.set_running_or_notify_cancel():
+                            # cancelled by the caller while pending
+                            del self._pending[swarm_hash]
+                            continue
+                        self._running.add(swarm_hash)
+                        return swarm_hash, future
+                if self._closed:
+                    return None, None
+                self._condition.wait()
+
+    def _work(self):
+        while True:
+            swarm_hash, future = self._next()
+            if swarm_hash is None:
+                return
+            try:
+                self.conn._retry_throttled(self.conn._download, swarm_hash)
+            except BaseException as e:
+                error = e
+            else:
+                error = None
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+            except InvalidStateError:
+                # a worker must survive whatever happened to its future, or queued references never run
+                pass
+            finally:
+                with self._condition:
+                    self._running.discard(swarm_hash)
+                    self._pending.pop(swarm_hash, None)
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._closed = True
+            for swarm_hash, future in list(self._pending.items()):
+                if swarm_hash not in self._running:
+                    future.cancel()
+                    del self._pending[swarm_hash]
+            self._queue = []
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+def load_manifest_references(path):
+    # a JSON list of references, a dataset manifest, or one reference per line
+    with open(path, 'r') as f:
+        text = f.read()
+    try:
+        manifest = json.loads(text)
+    except ValueError:
+        return [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('#')]
+    if isinstance(manifest, dict):
+        if 'partitions' in manifest:
+            return [p['reference'] for p in manifest['partitions']]
+        if 'references' in manifest:
+            return list(manifest['references'])
+        raise ValueError('Manifest %s contains no references' % path)
+    if isinstance(manifest, list):
+        return [str(reference) for reference in manifest]
+    raise ValueError('Manifest %s contains no references' % path)
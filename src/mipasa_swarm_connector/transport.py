@@ -0,0 +1,138 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import os
+import time
+
+
+class Transport:
+    # Sends HTTP requests for a SwarmConnection. request() returns an object with
+    # status_code, headers (case-insensitive), content, json(), iter_content(chunk_size)
+    # and close(), like requests.Response; connect_time, if present, is the time spent
+    # establishing a new connection for the request.
+
+    def request(self, method, url, data=None, headers=None, stream=False):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    # a session passed in belongs to the caller, who closes it; close() leaves it open
+    def __init__(self, session=None):
+        self.session = session
+
+    def __repr__(self):
+        return "<RequestsTransport>"
+
+    def request(self, method, url, data=None, headers=None, stream=False):
+        if self.session is not None:
+            return self.session.request(method, url, data=data, headers=headers, stream=stream)
+        import requests
+        return requests.request(method, url, data=data, headers=headers, stream=stream)
+
+
+class HTTPXResponse:
+    def __init__(self, response, connect_time=None):
+        self._response = response
+        self.connect_time = connect_time
+
+    @property
+    def status_code(self):
+        return self._response.status_code
+
+    @property
+    def headers(self):
+        return self._response.headers
+
+    @property
+    def content(self):
+        return self._response.read()
+
+    def json(self):
+        return self._response.json()
+
+    def iter_content(self, chunk_size=None):
+        return self._response.iter_bytes(chunk_size)
+
+    def close(self):
+        self._response.close()
+
+
+class HTTPXTransport(Transport):
+    # Multiplexes concurrent requests as HTTP/2 streams over a single connection.
+    # HTTP/2 is negotiated with TLS (ALPN); plain http:// URLs use HTTP/1.1 unless
+    # http1=False, which forces HTTP/2 with prior knowledge. close() only closes a client
+    # created by the transport, not one passed in.
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, client=None, http2=True, http1=True, max_connections=None, timeout=None, **client_kwargs):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError('HTTPX is not installed, but required for HTTPXTransport.') from e
+        if client is None:
+            client = httpx.Client(
+                http1=http1,
+                http2=http2,
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                **client_kwargs
+            )
+            self._owns_client = True
+        else:
+            self._owns_client = False
+        self.client = client
+
+    def __repr__(self):
+        return "<HTTPXTransport>"
+
+    def _body(self, data, headers):
+        if data is None or isinstance(data, (bytes, bytearray, memoryview)):
+            return bytes(data) if isinstance(data, (bytearray, memoryview)) else data
+        if hasattr(data, 'read'):
+            if hasattr(data, 'fileno'):
+                headers['Content-Length'] = str(os.fstat(data.fileno()).st_size - data.tell())
+            chunk_size = self.STREAM_CHUNK_SIZE
+            return iter(lambda: data.read(chunk_size), b'')
+        if hasattr(data, '__len__'):
+            headers['Content-Length'] = str(len(data))
+        return data
+
+    def request(self, method, url, data=None, headers=None, stream=False):
+        headers = dict(headers or {})
+        connect = {}
+
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.started':
+                connect['started'] = time.perf_counter()
+            elif event_name in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+                connect['complete'] = time.perf_counter()
+
+        request = self.client.build_request(
+            method, url, content=self._body(data, headers), headers=headers, extensions={'trace': trace}
+        )
+        response = self.client.send(request, stream=stream)
+        connect_time = None
+        if 'started' in connect and 'complete' in connect:
+            connect_time = connect['complete'] - connect['started']
+        return HTTPXResponse(response, connect_time=connect_time)
+
+    def close(self):
+        if self._owns_client:
+            self.client.close()
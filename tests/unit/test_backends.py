@@ -0,0 +1,101 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import pytest
+import pyarrow as pa
+from mipasa_swarm_connector import SwarmConnection, SharedMemoryCache
+from .util import mock_swarm_storage
+
+
+pl = pytest.importorskip('polars')
+
+
+def test_polars_round_trip(requests_mock):
+    files, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+    df = pl.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+
+    csv_hash = conn.write_file(df, as_type='csv')
+    assert files[csv_hash]['headers']['Content-Type'] == 'text/csv'
+    assert conn.read_csv(csv_hash, backend='polars').equals(df)
+
+    parquet_hash = conn.write_file(df.lazy(), as_type='parquet')
+    assert conn.read_parquet(parquet_hash, backend='polars').equals(df)
+    # pandas stays the default backend
+    assert list(conn.read_parquet(parquet_hash)['a']) == [1, 2, 3]
+
+
+def test_upload_type_detection(requests_mock):
+    files, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+    swarm_hash = conn.write_file(pl.DataFrame({'a': [1]}))
+    assert files[swarm_hash]['headers']['Content-Type'] == 'text/csv'
+    swarm_hash = conn.write_file(pa.table({'a': [1]}))
+    assert files[swarm_hash]['headers']['Content-Type'] == 'text/csv'
+
+
+def test_arrow_round_trip(requests_mock):
+    _, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url, backend='arrow')
+    table = pa.table({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+    assert conn.read_parquet(conn.write_file(table, as_type='parquet')).equals(table)
+    assert conn.read_csv(conn.write_file(table, as_type='csv')).equals(table)
+
+
+def test_lazy_read(requests_mock, tmp_path):
+    _, url = mock_swarm_storage(requests_mock)
+    df = pl.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+    swarm_hash = SwarmConnection(url).write_file(df, as_type='parquet')
+
+    conn = SwarmConnection(url, cache=SharedMemoryCache(str(tmp_path)))
+    for _ in range(2):
+        # the first read scans the downloaded bytes, the second the cached ones
+        lazy = conn.read_parquet(swarm_hash, backend='polars', lazy=True)
+        assert isinstance(lazy, pl.LazyFrame)
+        assert lazy.filter(pl.col('a') > 1).select('b').collect()['b'].to_list() == ['y', 'z']
+    assert requests_mock.call_count == 2
+
+    with pytest.raises(ValueError):
+        conn.read_parquet(swarm_hash, lazy=True)
+    with pytest.raises(ValueError):
+        conn.read_parquet(swarm_hash, backend='dask')
+
+
+def test_polars_reads_survive_eviction(requests_mock, tmp_path):
+    class EvictingCache(SharedMemoryCache):
+        # another process evicts the entry right after it was looked up
+        def get(self, swarm_hash):
+            entry = super().get(swarm_hash)
+            self.clear()
+            return entry
+
+    _, url = mock_swarm_storage(requests_mock)
+    df = pl.DataFrame({'a': [1, 2, 3]})
+    conn = SwarmConnection(url)
+    swarm_hash = conn.write_file(df, as_type='parquet')
+    content = conn.read_file(swarm_hash, as_type='bytes')
+
+    cache = EvictingCache(str(tmp_path))
+    conn = SwarmConnection(url, cache=cache)
+    cache.put(swarm_hash, content, 'parquet')
+    lazy = conn.read_parquet(swarm_hash, backend='polars', lazy=True)
+    assert swarm_hash not in cache
+    assert lazy.collect().equals(df)
+
+    cache.put(swarm_hash, content, 'parquet')
+    assert conn.read_parquet(swarm_hash, backend='polars').equals(df)
+    assert swarm_hash not in cache
@@ -0,0 +1,148 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import json
+import pandas as pd
+import pytest
+from mipasa_swarm_connector import SwarmConnection, SwarmBatchError, SwarmAPIError, PostageBatchManager
+from mipasa_swarm_connector.batches import estimate_chunks
+from .test_write_file import mock_upload
+from .util import mock_swarm_storage
+
+GATEWAY_URL = 'http://not-real-test-gateway-url'
+
+
+def stamp(batch_id, depth=20, bucket_depth=16, utilization=0, usable=True):
+    return {
+        'batchID': batch_id,
+        'depth': depth,
+        'bucketDepth': bucket_depth,
+        'utilization': utilization,
+        'usable': usable,
+        'exists': True,
+        'immutableFlag': True,
+        'batchTTL': 1000,
+    }
+
+
+def mock_stamps(requests_mock, stamps):
+    requests_mock.get('%s/stamps' % GATEWAY_URL, text=json.dumps({'stamps': stamps}))
+
+
+def test_estimate_chunks():
+    assert estimate_chunks(0) == 1 + 8
+    assert estimate_chunks(4096) == 1 + 8
+    assert estimate_chunks(4097) == 3 + 8
+    assert estimate_chunks(4096 * 128) == 129 + 8
+    assert estimate_chunks(4096 * 129) == 129 + 2 + 1 + 8
+
+
+def test_upload_picks_batch_with_room(requests_mock):
+    # bucket capacity is 2^(20-16) = 16; 'full' has no room left and 'unusable' is not usable yet
+    mock_stamps(requests_mock, [
+        stamp('full', utilization=16),
+        stamp('small', utilization=15),
+        stamp('roomy', utilization=2),
+        stamp('unusable', usable=False),
+    ])
+    rs, url = mock_upload(requests_mock, 'file.bin', content=b'{"reference": "testhash"}')
+
+    conn = SwarmConnection(url, batches=PostageBatchManager())
+    assert conn.write_file(b'x' * 10000) == 'testhash'
+    assert rs[-1][0].headers['swarm-postage-batch-id'] == 'roomy'
+    assert conn.batches.batches['roomy'].reserved_chunks == estimate_chunks(10000)
+
+    with pytest.raises(SwarmBatchError) as e_info:
+        conn.batches.reserve(conn, 4096 * 500000)
+    assert e_info.value.required_chunks == estimate_chunks(4096 * 500000)
+
+    # explicitly requested batches are checked too
+    with pytest.raises(SwarmBatchError) as e_info:
+        conn.write_file(b'x', batch_id='full')
+    assert e_info.value.batch_id == 'full'
+    assert len(rs) == 1
+    conn.write_file(b'x', batch_id='not-tracked')
+    assert rs[-1][0].headers['swarm-postage-batch-id'] == 'not-tracked'
+
+
+def test_batches_rotate_and_refresh(requests_mock):
+    mock_stamps(requests_mock, [stamp('a', utilization=10), stamp('b', utilization=10), stamp('c')])
+    rs, url = mock_upload(requests_mock, 'file.bin', content=b'{"reference": "testhash"}')
+
+    conn = SwarmConnection(url, batches=['a', 'b'])
+    used = set()
+    for _ in range(4):
+        conn.write_file(b'x' * 4096 * 1000)
+        used.add(rs[-1][0].headers['swarm-postage-batch-id'])
+    assert used == {'a', 'b'}
+    assert len([r for r in requests_mock.request_history if r.path == '/stamps']) == 1
+
+    conn.batches.invalidate()
+    conn.write_file(b'x')
+    assert len([r for r in requests_mock.request_history if r.path == '/stamps']) == 2
+
+
+def test_exhausted_batch_is_invalidated(requests_mock):
+    mock_stamps(requests_mock, [stamp('a')])
+    rs, url = mock_upload(requests_mock, 'file.bin', content=b'{"message": "batch is overissued"}', status_code=402)
+
+    conn = SwarmConnection(url, batches=PostageBatchManager())
+    with pytest.raises(SwarmAPIError):
+        conn.write_file(b'x')
+    assert not conn.batches.batches['a'].usable
+
+    mock_stamps(requests_mock, [stamp('a', utilization=16)])
+    with pytest.raises(SwarmBatchError):
+        conn.write_file(b'x')
+    assert len(rs) == 1
+
+
+def test_stamps_unavailable(requests_mock):
+    requests_mock.get('%s/stamps' % GATEWAY_URL, status_code=500)
+    with pytest.raises(SwarmAPIError) as e_info:
+        SwarmConnection(GATEWAY_URL, batches=PostageBatchManager()).write_file(b'x')
+    assert e_info.value.status_code == 500
+
+
+def test_failed_uploads_release_reservation(requests_mock, mocker):
+    mocker.patch('time.sleep')
+    mock_stamps(requests_mock, [stamp('a')])
+    requests_mock.post('%s/bzz' % GATEWAY_URL, [
+        {'status_code': 429},
+        {'status_code': 503},
+        {'status_code': 201, 'text': json.dumps({'reference': 'testhash'})},
+    ])
+
+    conn = SwarmConnection(GATEWAY_URL, batches=PostageBatchManager())
+    assert conn.write_files([b'x' * 10000]) == ['testhash']
+    assert conn.batches.batches['a'].reserved_chunks == estimate_chunks(10000)
+
+    requests_mock.post('%s/bzz' % GATEWAY_URL, status_code=500)
+    with pytest.raises(SwarmAPIError):
+        conn.write_file(b'x' * 10000)
+    assert conn.batches.batches['a'].reserved_chunks == estimate_chunks(10000)
+
+
+def test_transform_reserves_size_hint(requests_mock):
+    mock_stamps(requests_mock, [stamp('a')])
+    _, url = mock_swarm_storage(requests_mock, GATEWAY_URL)
+    conn = SwarmConnection(url, batches=PostageBatchManager())
+    source = conn.write_file(pd.DataFrame({'a': [1, 2, 3]}), as_type='csv')
+    reserved = conn.batches.batches['a'].reserved_chunks
+
+    conn.transform(source, lambda df: df, size_hint=4096 * 1000)
+    assert conn.batches.batches['a'].reserved_chunks - reserved == estimate_chunks(4096 * 1000)
@@ -0,0 +1,113 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import errno
+import os
+import json
+import multiprocessing
+import pytest
+from mipasa_swarm_connector import SwarmConnection, SharedMemoryCache
+from .test_read_file import mock_bzz_link
+
+
+def _put_from_other_process(directory):
+    SharedMemoryCache(directory).put('shared', b'from-child', 'bytes')
+
+
+def test_cache_hit_skips_gateway(requests_mock, tmp_path):
+    mock_bzz_link(requests_mock, {
+        'test': {
+            'headers': {
+                'Content-Type': 'application/json'
+            },
+            'content': json.dumps({'a': 1}).encode('utf-8')
+        },
+    })
+
+    conn = SwarmConnection(cache=SharedMemoryCache(str(tmp_path)))
+    assert {'a': 1} == conn.read_file('test')
+    assert requests_mock.call_count == 1
+
+    assert {'a': 1} == conn.read_file('test')
+    assert {'a': 1} == SwarmConnection(cache=SharedMemoryCache(str(tmp_path))).read_json('test')
+    assert requests_mock.call_count == 1
+
+    raw = conn.read_file('test', as_type='bytes')
+    assert isinstance(raw, bytes)
+    assert raw == b'{"a": 1}'
+
+
+def test_cache_is_shared_between_processes(tmp_path):
+    p = multiprocessing.get_context('spawn').Process(target=_put_from_other_process, args=(str(tmp_path),))
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+    view, data_type = SharedMemoryCache(str(tmp_path)).get('shared')
+    assert isinstance(view, memoryview)
+    assert view == b'from-child'
+    assert data_type == 'bytes'
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = SharedMemoryCache(str(tmp_path), max_bytes=10)
+    cache.put('a', b'aaaa', 'bytes')
+    cache.put('b', b'bbbb', 'bytes')
+    os.utime(cache.path('a'), (1, 1))
+    os.utime(cache.path('b'), (2, 2))
+    assert cache.get('a') is not None
+
+    cache.put('c', b'cccc', 'text')
+    assert cache.get('b') is None
+    assert cache.get('a')[0] == b'aaaa'
+    assert cache.get('c') == (memoryview(b'cccc'), 'text')
+    assert cache.size() == 8
+
+
+def test_cache_empty_and_unsafe_hashes(tmp_path):
+    cache = SharedMemoryCache(str(tmp_path))
+    cache.put('../escape/x', b'', 'csv')
+    assert cache.get('../escape/x') == (memoryview(b''), 'csv')
+    assert os.path.dirname(cache.path('../escape/x')) == str(tmp_path)
+
+    cache.discard('../escape/x')
+    assert cache.get('../escape/x') is None
+
+
+def test_cache_directory_must_be_owned(tmp_path, mocker):
+    cache = SharedMemoryCache()
+    assert str(os.getuid()) in os.path.basename(cache.directory)
+    assert os.stat(cache.directory).st_mode & 0o077 == 0
+
+    mocker.patch('os.getuid', return_value=os.stat(str(tmp_path)).st_uid + 1)
+    with pytest.raises(PermissionError):
+        SharedMemoryCache(str(tmp_path))
+
+
+def test_cache_failure_does_not_fail_read(requests_mock, tmp_path):
+    class FullCache(SharedMemoryCache):
+        def put(self, swarm_hash, content, data_type):
+            raise OSError(errno.ENOSPC, 'No space left on device')
+
+    mock_bzz_link(requests_mock, {
+        'test': {
+            'headers': {
+                'Content-Type': 'application/json'
+            },
+            'content': b'{"a": 1}'
+        },
+    })
+    assert SwarmConnection(cache=FullCache(str(tmp_path))).read_file('test') == {'a': 1}
@@ -0,0 +1,145 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import io
+import json
+import os
+from mipasa_swarm_connector import SwarmConnection
+from mipasa_swarm_connector.cli import main, Journal
+from .util import mock_swarm_storage
+
+
+def run(*argv):
+    out, err = io.StringIO(), io.StringIO()
+    status = main(list(argv), out=out, err=err)
+    return status, out.getvalue(), err.getvalue()
+
+
+def make_tree(root):
+    os.makedirs(os.path.join(root, 'sub'))
+    with open(os.path.join(root, 'a.csv'), 'wb') as f:
+        f.write(b'a,b\n1,2\n')
+    with open(os.path.join(root, 'sub', 'b.bin'), 'wb') as f:
+        f.write(b'\x00' * 5000)
+
+
+def uploads(requests_mock):
+    return [r for r in requests_mock.request_history if r.method == 'POST']
+
+
+def test_put_and_get_with_journal(requests_mock, tmp_path):
+    files, url = mock_swarm_storage(requests_mock)
+    src = str(tmp_path / 'src')
+    make_tree(src)
+    journal = str(tmp_path / 'put.jsonl')
+
+    status, out, err = run('--gateway-url', url, 'put', src, '--journal', journal, '--batch-id', 'abc')
+    assert status == 0
+    references = dict(line.split('\t')[::-1] for line in out.splitlines())
+    assert len(references) == 2
+    assert 'put: 2 transferred, 0 skipped, 0 failed' in err
+    assert 'latency per file' in err
+    assert uploads(requests_mock)[0].headers['swarm-postage-batch-id'] == 'abc'
+    csv_upload = [r for r in uploads(requests_mock) if 'a.csv' in r.url][0]
+    assert csv_upload.headers['Content-Type'] == 'text/csv'
+
+    # a resumed job skips files recorded in the journal
+    status, out, err = run('--gateway-url', url, 'put', src, '--journal', journal)
+    assert status == 0
+    assert 'put: 0 transferred, 2 skipped' in err
+    assert len(uploads(requests_mock)) == 2
+
+    refs_file = tmp_path / 'refs.txt'
+    refs_file.write_text('\n'.join(references.values()))
+    dst = str(tmp_path / 'dst')
+    status, out, err = run('--gateway-url', url, 'get', '-i', str(refs_file), '-o', dst, '--journal', str(tmp_path / 'get.jsonl'))
+    assert status == 0
+    with open(os.path.join(dst, references[os.path.join(src, 'sub', 'b.bin')]), 'rb') as f:
+        assert f.read() == b'\x00' * 5000
+    assert not [name for name in os.listdir(dst) if name.endswith('.part')]
+
+    status, out, err = run('--gateway-url', url, 'get', '-i', str(refs_file), '-o', dst, '--journal', str(tmp_path / 'get.jsonl'))
+    assert 'get: 0 transferred, 2 skipped' in err
+
+
+def test_sync_and_restore_index(requests_mock, tmp_path):
+    files, url = mock_swarm_storage(requests_mock)
+    src = str(tmp_path / 'src')
+    make_tree(src)
+
+    status, out, err = run('--gateway-url', url, 'sync', src)
+    assert status == 0
+    index_hash = out.splitlines()[-1].split('\t')[0]
+    index = SwarmConnection(url).read_json(index_hash)
+    assert sorted(index['files']) == ['a.csv', 'sub/b.bin']
+    assert os.path.exists(os.path.join(src, '.swarm-sync-journal.jsonl'))
+
+    with open(os.path.join(src, 'a.csv'), 'ab') as f:
+        f.write(b'3,4\n')
+    requests_mock.reset_mock()
+    status, out, err = run('--gateway-url', url, 'sync', src)
+    # only the changed file and the new index are uploaded
+    assert len(uploads(requests_mock)) == 2
+    index_hash = out.splitlines()[-1].split('\t')[0]
+
+    dst = str(tmp_path / 'dst')
+    status, out, err = run('--gateway-url', url, '-q', 'get', '--index', index_hash, '-o', dst)
+    assert status == 0
+    assert err == ''
+    with open(os.path.join(dst, 'a.csv'), 'rb') as f:
+        assert f.read() == b'a,b\n1,2\n3,4\n'
+    assert os.path.getsize(os.path.join(dst, 'sub', 'b.bin')) == 5000
+
+
+def test_failures_are_reported(requests_mock, tmp_path):
+    files, url = mock_swarm_storage(requests_mock)
+
+    status, out, err = run('--gateway-url', url, 'get', 'missing', '-o', str(tmp_path))
+    assert status == 1
+    assert "failed: missing -> %s" % os.path.join(str(tmp_path), 'missing') in err
+    assert 'get: 0 transferred, 0 skipped, 1 failed' in err
+
+    status, out, err = run('--gateway-url', url, 'get', '-o', str(tmp_path))
+    assert status == 2
+    assert err == 'error: No references to download\n'
+
+    not_index = SwarmConnection(url).write_file({'a': 1})
+    status, out, err = run('--gateway-url', url, 'get', '--index', not_index)
+    assert status == 2
+    assert 'is not a directory index' in err
+
+    missing = os.path.join(str(tmp_path), 'missing.csv')
+    uploaded = len(uploads(requests_mock))
+    status, out, err = run('--gateway-url', url, 'put', missing)
+    assert status == 2
+    assert err == "error: [Errno 2] No such file or directory: '%s'\n" % missing
+    assert len(uploads(requests_mock)) == uploaded
+
+    status, out, err = run('--gateway-url', url, 'sync', os.path.join(str(tmp_path), 'missing'))
+    assert status == 2
+
+
+def test_journal_ignores_truncated_lines(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with open(path, 'w') as f:
+        f.write(json.dumps({'op': 'get', 'reference': 'a'}) + '\n{"op": "get", "refer')
+    journal = Journal(path)
+    assert journal.find(op='get', reference='a') is not None
+    assert journal.find(op='get', reference='b') is None
+
+    journal.record({'op': 'get', 'reference': 'b'})
+    assert Journal(path).find(op='get', reference='b') is not None
@@ -0,0 +1,143 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import threading
+import time
+import pytest
+from mipasa_swarm_connector import SwarmConnection, SwarmAPIError
+from mipasa_swarm_connector.concurrency import AdaptiveLimiter, TokenBucket
+from .test_read_file import mock_bzz_link
+from .test_write_file import mock_upload
+from .util import mock_swarm_storage
+
+
+def test_limiter_additive_increase_multiplicative_decrease():
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=5)
+    for _ in range(4):
+        with limiter.slot() as slot:
+            slot.observe_latency(0.1)
+    assert limiter.limit == pytest.approx(5.0, abs=0.2)
+
+    for _ in range(20):
+        with limiter.slot():
+            pass
+    assert limiter.limit == 5
+
+    with limiter.slot() as slot:
+        slot.throttle()
+    assert limiter.limit == 2.5
+
+    with limiter.slot() as slot:
+        slot.observe_latency(1.0)
+    assert limiter.limit == 1.25
+
+    with limiter.slot() as slot:
+        slot.fail()
+    assert limiter.limit == 1.25
+
+    with pytest.raises(RuntimeError):
+        with limiter.slot():
+            raise RuntimeError()
+    assert limiter.limit == 1.25
+    assert limiter.in_flight == 0
+
+
+def test_limiter_backs_off_once_per_congestion_event():
+    limiter = AdaptiveLimiter(initial_limit=8)
+    slots = [limiter.acquire() for _ in range(8)]
+    for slot in slots:
+        slot.throttle()
+        limiter.release(slot)
+    assert limiter.limit == 4
+
+
+def test_limiter_bounds_in_flight_requests():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=2)
+    peak = 0
+    lock = threading.Lock()
+
+    def work():
+        nonlocal peak
+        with limiter.slot():
+            with lock:
+                peak = max(peak, limiter.in_flight)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak == 2
+
+
+def test_token_bucket():
+    bucket = TokenBucket(1000, burst=100)
+    assert bucket.consume(100) == 0
+    waited = bucket.consume(50)
+    assert 0.03 < waited <= 0.05
+
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_bandwidth_limit_applies_while_transferring(requests_mock):
+    class RecordingBucket(TokenBucket):
+        def consume(self, amount):
+            self.consumed.append(amount)
+            return 0
+
+    bucket = RecordingBucket(10 ** 9)
+    bucket.consumed = []
+    _, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url, bandwidth_limit=bucket)
+    content = b'x' * 200000
+    swarm_hash = conn.write_file(content, as_type='bytes')
+    assert len(bucket.consumed) == 4
+    assert max(bucket.consumed) <= 64 * 1024
+
+    bucket.consumed = []
+    assert conn.read_file(swarm_hash, as_type='bytes') == content
+    assert len(bucket.consumed) == 4
+    assert sum(bucket.consumed) == len(content)
+
+
+def test_read_files_retries_throttled_requests(requests_mock):
+    mock_bzz_link(requests_mock, {'a': b'a', 'b': b'b', 'c': b'c'})
+    url = 'http://not-real-test-gateway-url'
+    requests_mock.get(url + '/bzz/b', [{'status_code': 429}, {'status_code': 503}, {'content': b'b'}])
+
+    conn = SwarmConnection(url, concurrency=AdaptiveLimiter(initial_limit=8))
+    assert conn.read_files(['a', 'b', 'c']) == [b'a', b'b', b'c']
+    assert conn.concurrency.limit < 8
+    assert conn.read_files([]) == []
+
+    requests_mock.get(url + '/bzz/b', status_code=429)
+    with pytest.raises(SwarmAPIError) as e_info:
+        conn.read_files(['a', 'b'], max_retries=1)
+    assert e_info.value.status_code == 429
+
+
+def test_write_files(requests_mock):
+    rs, url = mock_upload(requests_mock, 'file.bin', content=b'{"reference": "testhash"}')
+    refs = SwarmConnection(url, bandwidth_limit=10 ** 9).write_files([b'1', b'2', b'3'])
+    assert refs == ['testhash', 'testhash', 'testhash']
+    assert sorted(b''.join(r[0].body) for r in rs) == [b'1', b'2', b'3']
+    assert all(r[0].headers['Content-Length'] == '1' for r in rs)
+
+    with pytest.raises(ValueError):
+        SwarmConnection(url).write_files([b'1'], file_names=['a', 'b'])
@@ -0,0 +1,157 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import datetime
+import pandas as pd
+import pytest
+from mipasa_swarm_connector import SwarmConnection, SwarmTypeError
+from mipasa_swarm_connector.dataset import prune_partitions
+from .util import mock_swarm_storage
+
+
+def make_frame(days, region='eu'):
+    return pd.DataFrame({
+        'day': [d for d in days for _ in range(2)],
+        'region': [region] * (2 * len(days)),
+        'value': [float(i) for i in range(2 * len(days))],
+    })
+
+
+def count_uploads(requests_mock):
+    return len([r for r in requests_mock.request_history if r.method == 'POST'])
+
+
+def test_write_and_read_dataset(requests_mock):
+    files, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+
+    df = make_frame(['2024-01-01', '2024-01-02', '2024-01-03'])
+    manifest_hash = conn.write_dataset(df, partition_by='day')
+    assert count_uploads(requests_mock) == 4
+
+    manifest = conn.read_json(manifest_hash)
+    assert manifest['format'] == 'mipasa-swarm-dataset'
+    assert manifest['partition_by'] == ['day']
+    assert manifest['columns'] == ['day', 'region', 'value']
+    assert [p['values'] for p in manifest['partitions']] == [{'day': '2024-01-01'}, {'day': '2024-01-02'}, {'day': '2024-01-03'}]
+    assert manifest['partitions'][1]['num_rows'] == 2
+    assert manifest['partitions'][1]['statistics']['value'] == {'null_count': 0, 'min': 2.0, 'max': 3.0}
+    assert manifest['partitions'][1]['file_name'] == 'part-00001.parquet'
+
+    assert conn.read_dataset(manifest_hash).equals(df)
+
+    requests_mock.reset_mock()
+    result = conn.read_dataset(manifest_hash, filters=[('day', '>=', '2024-01-02'), ('value', '<', 5.0)], columns=['value'])
+    assert list(result.columns) == ['value']
+    assert result['value'].tolist() == [2.0, 3.0, 4.0]
+    # the manifest and the two matching partitions
+    assert requests_mock.call_count == 3
+
+    result = conn.read_dataset(manifest_hash, filters=[[('day', '==', '2024-01-01')], [('value', 'in', [5.0])]])
+    assert result['value'].tolist() == [0.0, 1.0, 5.0]
+
+    empty = conn.read_dataset(manifest_hash, filters=[('day', '==', '2023-12-31')], columns=['day', 'value'])
+    assert len(empty) == 0
+    assert list(empty.columns) == ['day', 'value']
+
+
+def test_append_uploads_only_new_partitions(requests_mock):
+    files, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+
+    first = conn.write_dataset(make_frame(['2024-01-01', '2024-01-02']), partition_by=['day', 'region'])
+    requests_mock.reset_mock()
+
+    second = conn.write_dataset(make_frame(['2024-01-03'], region='us'), append_to=first)
+    assert count_uploads(requests_mock) == 2
+    assert first != second
+
+    manifest = conn.read_json(second)
+    assert [p['values'] for p in manifest['partitions']] == [
+        {'day': '2024-01-01', 'region': 'eu'},
+        {'day': '2024-01-02', 'region': 'eu'},
+        {'day': '2024-01-03', 'region': 'us'},
+    ]
+    assert manifest['partitions'][2]['file_name'] == 'part-00002.parquet'
+    assert len(conn.read_dataset(first)) == 4
+    assert conn.read_dataset(second, filters=[('region', '==', 'us')])['day'].tolist() == ['2024-01-03', '2024-01-03']
+
+    with pytest.raises(ValueError):
+        conn.write_dataset(make_frame(['2024-01-04']), partition_by='region', append_to=first)
+
+
+def test_dataset_errors(requests_mock):
+    files, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+
+    with pytest.raises(SwarmTypeError):
+        conn.write_dataset([1, 2, 3])
+    with pytest.raises(ValueError):
+        conn.write_dataset(make_frame(['2024-01-01']), partition_by='missing')
+
+    not_a_manifest = conn.write_file({'a': 1})
+    with pytest.raises(SwarmTypeError) as e_info:
+        conn.read_dataset(not_a_manifest)
+    assert e_info.value.expected_type == 'dataset'
+
+    manifest_hash = conn.write_dataset(make_frame(['2024-01-01']))
+    with pytest.raises(ValueError):
+        conn.read_dataset(manifest_hash, filters=[('value', '~', 1)])
+
+
+def test_prune_partitions_with_statistics():
+    def partition(lo, hi, null_count=0):
+        return {'values': {}, 'statistics': {'x': {'min': lo, 'max': hi, 'null_count': null_count}}}
+
+    manifest = {'partitions': [partition(0, 10), partition(5, 5), partition(None, None, 3), partition(5, 5, 1)]}
+
+    def kept(filters):
+        return [manifest['partitions'].index(p) for p in prune_partitions(manifest, filters)]
+
+    assert kept(None) == [0, 1, 2, 3]
+    assert kept([('x', '>', 7)]) == [0]
+    assert kept([('x', '==', 5)]) == [0, 1, 3]
+    assert kept([('x', '!=', 5)]) == [0, 2, 3]
+    assert kept([('x', 'not in', [5, 6])]) == [0, 2, 3]
+    assert kept([('x', 'in', [11, 12])]) == []
+    assert kept([('x', '<', 'text')]) == [0, 1, 3]
+    assert kept([('y', '==', 1)]) == [0, 1, 2, 3]
+
+
+def test_prune_partitions_with_dates():
+    df = pd.DataFrame({'t': pd.to_datetime(['2024-01-01', '2024-01-05'])})
+    from mipasa_swarm_connector.dataset import _partition_entry
+    manifest = {'partitions': [_partition_entry(df, [], ())]}
+    assert manifest['partitions'][0]['statistics']['t']['min'] == '2024-01-01T00:00:00'
+    assert len(prune_partitions(manifest, [('t', '>', datetime.datetime(2024, 1, 4))])) == 1
+    assert len(prune_partitions(manifest, [('t', '>', datetime.datetime(2024, 1, 6))])) == 0
+
+
+def test_read_dataset_filters_datetimes_with_strings(requests_mock):
+    _, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+    df = pd.DataFrame({
+        't': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03']),
+        'value': [1, 2, 3],
+    })
+    manifest_hash = conn.write_dataset(df, partition_by='t')
+    assert conn.read_json(manifest_hash)['column_kinds'] == {'t': 'datetime'}
+
+    # pandas compares string values with a datetime column as timestamps, and so must pruning
+    assert list(conn.read_dataset(manifest_hash, filters=[('t', '==', '2024-01-02')])['value']) == [2]
+    assert list(conn.read_dataset(manifest_hash, filters=[('t', '<=', '2024-01-02')])['value']) == [1, 2]
+    assert list(conn.read_dataset(manifest_hash, filters=[('t', 'in', ['2024-01-03'])])['value']) == [3]
@@ -0,0 +1,60 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import subprocess
+import sys
+import pytest
+import mipasa_swarm_connector
+from mipasa_swarm_connector.detection import parse_header, detect_type
+
+
+def imported_modules(code):
+    out = subprocess.check_output([sys.executable, '-c', code + '\nimport sys\nprint(" ".join(sys.modules))'])
+    return set(out.decode('utf-8').split())
+
+
+def test_import_is_lightweight():
+    modules = imported_modules('import mipasa_swarm_connector\nfrom mipasa_swarm_connector import SwarmAPIError')
+    for heavy in ['requests', 'pandas', 'pyarrow', 'cgi', 'mipasa_swarm_connector.client']:
+        assert heavy not in modules
+
+    modules = imported_modules('from mipasa_swarm_connector import SwarmConnection')
+    assert 'mipasa_swarm_connector.client' in modules
+    for heavy in ['requests', 'pandas', 'pyarrow', 'cgi']:
+        assert heavy not in modules
+
+
+def test_lazy_attributes():
+    assert 'SwarmConnection' in dir(mipasa_swarm_connector)
+    assert mipasa_swarm_connector.SwarmConnection.__name__ == 'SwarmConnection'
+    with pytest.raises(AttributeError):
+        mipasa_swarm_connector.NotAnAttribute
+
+
+def test_parse_header():
+    assert parse_header('text/csv') == ('text/csv', {})
+    assert parse_header('Text/CSV; charset=UTF-8') == ('text/csv', {'charset': 'UTF-8'})
+    assert parse_header('attachment; filename="a;b.csv"; size=3') == ('attachment', {'filename': 'a;b.csv', 'size': '3'})
+    assert parse_header('inline; FileName="say \\"hi\\".json"') == ('inline', {'filename': 'say "hi".json'})
+    assert parse_header('attachment; broken') == ('attachment', {})
+
+
+def test_detect_type():
+    assert detect_type({'Content-Type': 'application/json; charset=utf-8'}) == 'json'
+    assert detect_type({'Content-Disposition': 'attachment; filename="DATA.PARQUET"'}) == 'parquet'
+    assert detect_type({'Content-Type': 'application/octet-stream', 'Content-Disposition': 'inline; filename="a.txt"'}) == 'text'
+    assert detect_type({}) == 'bytes'
@@ -0,0 +1,115 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+import pytest
+from mipasa_swarm_connector import SwarmConnection, SwarmAPIError, SharedMemoryCache, Instrumentation, MetricsCollector
+from .test_read_file import mock_bzz_link
+from .test_write_file import mock_upload
+
+
+class RecordingInstrumentation(Instrumentation):
+    def __init__(self):
+        self.events = []
+
+    def on_phase(self, operation, phase, seconds):
+        self.events.append(('phase', operation, phase))
+
+    def on_request(self, operation, gateway_url, status_code, bytes_in, bytes_out):
+        self.events.append(('request', operation, status_code, bytes_in, bytes_out))
+
+    def on_cache(self, operation, hit):
+        self.events.append(('cache', operation, hit))
+
+
+def test_callbacks_per_operation(requests_mock):
+    mock_bzz_link(requests_mock, {
+        'test': {
+            'headers': {
+                'Content-Type': 'application/json'
+            },
+            'content': b'{"a": 1}'
+        },
+    })
+    rs, url = mock_upload(requests_mock, 'file.json', content=b'{"reference": "testhash"}')
+
+    recorder = RecordingInstrumentation()
+    conn = SwarmConnection(url, instrumentation=recorder)
+    assert {'a': 1} == conn.read_file('test')
+    assert recorder.events == [
+        ('phase', 'read', 'ttfb'),
+        ('phase', 'read', 'transfer'),
+        ('request', 'read', 200, 8, 0),
+        ('phase', 'read', 'decode'),
+    ]
+
+    recorder.events.clear()
+    with pytest.raises(SwarmAPIError):
+        conn.read_file('missing')
+    assert recorder.events == [('phase', 'read', 'ttfb'), ('request', 'read', 404, 0, 0)]
+
+    recorder.events.clear()
+    assert 'testhash' == conn.write_file({'a': 1})
+    assert recorder.events == [
+        ('phase', 'write', 'encode'),
+        ('phase', 'write', 'transfer'),
+        ('request', 'write', 201, 25, 8),
+    ]
+
+
+def test_metrics_collector_prometheus_export(requests_mock, tmp_path):
+    mock_bzz_link(requests_mock, {'test': b'test'})
+
+    metrics = MetricsCollector(buckets=[0.5, 1000])
+    conn = SwarmConnection(cache=SharedMemoryCache(str(tmp_path)), instrumentation=metrics)
+    assert metrics.cache_hit_rate() is None
+    for _ in range(4):
+        conn.read_file('test')
+    with pytest.raises(SwarmAPIError):
+        conn.read_file('missing')
+
+    assert metrics.cache_hit_rate() == 0.6
+    assert metrics.phases[('read', 'ttfb')].count == 2
+    assert metrics.phases[('read', 'decode')].count == 4
+    assert metrics.bytes[('read', 'in')] == 4
+
+    text = metrics.to_prometheus()
+    lines = text.splitlines()
+    assert '# TYPE mipasa_swarm_phase_seconds histogram' in lines
+    assert 'mipasa_swarm_phase_seconds_bucket{operation="read",phase="transfer",le="1000.0"} 1' in lines
+    assert 'mipasa_swarm_phase_seconds_bucket{operation="read",phase="transfer",le="+Inf"} 1' in lines
+    assert 'mipasa_swarm_phase_seconds_count{operation="read",phase="ttfb"} 2' in lines
+    assert 'mipasa_swarm_bytes_total{operation="read",direction="in"} 4' in lines
+    assert 'mipasa_swarm_responses_total{gateway="http://not-real-test-gateway-url",operation="read",status="200"} 1' in lines
+    assert 'mipasa_swarm_responses_total{gateway="http://not-real-test-gateway-url",operation="read",status="404"} 1' in lines
+    assert 'mipasa_swarm_cache_lookups_total{operation="read",result="hit"} 3' in lines
+    assert 'mipasa_swarm_cache_lookups_total{operation="read",result="miss"} 2' in lines
+    assert text.endswith('\n')
+
+    metrics.reset()
+    assert metrics.cache_hit_rate() is None
+
+
+def test_histogram_quantile():
+    from mipasa_swarm_connector.instrumentation import Histogram
+
+    h = Histogram([1, 2, 4])
+    assert h.quantile(0.5) is None
+    for v in [0.5, 1.5, 1.5, 3, 10]:
+        h.observe(v)
+    assert h.quantile(0.5) == 2
+    assert h.quantile(0.8) == 4
+    assert h.quantile(1.0) == float('inf')
+    assert h.sum == 16.5
@@ -0,0 +1,113 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import threading
+import pandas as pd
+import pytest
+from mipasa_swarm_connector import SwarmConnection, SwarmTypeError, AdaptiveLimiter
+from mipasa_swarm_connector.pipeline import transform
+from .util import mock_swarm_storage
+
+
+def make_source(requests_mock, as_type, rows=1000):
+    files, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+    df = pd.DataFrame({'id': range(rows), 'group': [i % 10 for i in range(rows)]})
+    return files, conn, conn.write_file(df, as_type=as_type)
+
+
+def test_transform_csv(requests_mock):
+    files, conn, source = make_source(requests_mock, 'csv')
+    result = conn.transform(source, lambda df: df[df['group'] == 3])
+    assert files[result]['headers']['Content-Type'] == 'text/csv'
+    df = conn.read_csv(result)
+    assert list(df.columns) == ['id', 'group']
+    assert list(df['id']) == list(range(3, 1000, 10))
+
+
+def test_transform_changes_type(requests_mock):
+    pl = pytest.importorskip('polars')
+    _, conn, source = make_source(requests_mock, 'parquet')
+    result = conn.transform(
+        source, lambda df: df.with_columns(double=pl.col('id') * 2), out_type='csv', backend='polars'
+    )
+    df = conn.read_csv(result, backend='polars')
+    assert df.columns == ['id', 'group', 'double']
+    assert df['double'].to_list() == [i * 2 for i in range(1000)]
+
+
+def test_transform_dropping_all_batches(requests_mock):
+    _, conn, source = make_source(requests_mock, 'csv')
+    result = conn.transform(source, lambda batch: None, backend='arrow')
+    assert conn.read_file(result, as_type='bytes') == b'"id","group"\n'
+
+
+@pytest.mark.parametrize('out_type', ['csv', 'parquet'])
+@pytest.mark.parametrize('first', [True, False])
+def test_transform_with_empty_batches(requests_mock, out_type, first):
+    # large enough to be decoded in several batches; only the last (and maybe the first) keep rows
+    rows = 300000
+    _, conn, source = make_source(requests_mock, 'csv', rows=rows)
+    kept = (list(range(10)) if first else []) + list(range(rows - 10, rows))
+
+    def fn(df):
+        df = df[df['id'].isin(kept)]
+        # an empty object column converts to the null type
+        return df.assign(label=pd.Series(['row %d' % i for i in df['id']], index=df.index, dtype=object))
+
+    result = conn.transform(source, fn, out_type=out_type)
+    df = conn.read_file(result, as_type=out_type)
+    assert list(df['id']) == kept
+    assert list(df['label']) == ['row %d' % i for i in kept]
+
+
+def test_transform_error_is_not_published(requests_mock):
+    files, conn, source = make_source(requests_mock, 'csv')
+
+    def fail(df):
+        raise RuntimeError('broken transform')
+
+    with pytest.raises(RuntimeError, match='broken transform'):
+        conn.transform(source, fail)
+    assert list(files) == [source]
+
+
+def test_transform_unsupported_type(requests_mock):
+    _, url = mock_swarm_storage(requests_mock)
+    conn = SwarmConnection(url)
+    source = conn.write_file({'a': 1}, as_type='json')
+    with pytest.raises(SwarmTypeError):
+        conn.transform(source, lambda df: df)
+    with pytest.raises(ValueError):
+        conn.transform(source, lambda df: df, as_type='json')
+
+
+def test_transform_with_single_request_limit(requests_mock):
+    # the download and upload overlap, so they must not wait for each other at the limiter
+    files, conn, source = make_source(requests_mock, 'csv', rows=300000)
+    conn.concurrency = AdaptiveLimiter(initial_limit=1, max_limit=1)
+    result = {}
+
+    def run():
+        result['reference'] = transform(conn, source, lambda df: df, chunk_size=64 * 1024, max_buffered_chunks=2)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert len(conn.read_csv(result['reference'])) == 300000
+    assert conn.concurrency.in_flight == 0
@@ -0,0 +1,184 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import json
+import threading
+import pytest
+from mipasa_swarm_connector import SwarmConnection, SwarmAPIError, MemoryCache, SharedMemoryCache, MetricsCollector
+from mipasa_swarm_connector.prefetch import load_manifest_references
+from .test_read_file import mock_bzz_link
+
+
+def gateway_requests(requests_mock, path):
+    return len([r for r in requests_mock.request_history if r.path == path])
+
+
+def test_prefetch_fills_cache(requests_mock):
+    mock_bzz_link(requests_mock, {'a': b'a', 'b': b'b'})
+
+    metrics = MetricsCollector()
+    conn = SwarmConnection(instrumentation=metrics)
+    futures = conn.prefetch(['a', 'b'])
+    assert isinstance(conn.cache, MemoryCache)
+    for f in futures:
+        assert f.result(timeout=5) is None
+
+    assert conn.read_file('a') == b'a'
+    assert conn.read_file('b') == b'b'
+    assert requests_mock.call_count == 2
+    assert metrics.cache_hit_rate() == 1.0
+
+    # already cached references complete immediately
+    assert conn.prefetch('a')[0].done()
+    conn.close()
+
+
+def test_prefetch_failure_is_reported_on_read(requests_mock, tmp_path):
+    mock_bzz_link(requests_mock, {})
+
+    conn = SwarmConnection(cache=SharedMemoryCache(str(tmp_path)))
+    future = conn.prefetch('missing')[0]
+    with pytest.raises(SwarmAPIError):
+        future.result(timeout=5)
+    with pytest.raises(SwarmAPIError) as e_info:
+        conn.read_file('missing')
+    assert e_info.value.status_code == 404
+    conn.close()
+
+
+def test_reads_join_in_flight_prefetch(requests_mock):
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_handler(request, context):
+        started.set()
+        release.wait(5)
+        context.status_code = 200
+        return b'slow'
+
+    mock_bzz_link(requests_mock, {})
+    requests_mock.get('http://not-real-test-gateway-url/bzz/slow', content=slow_handler)
+
+    conn = SwarmConnection(prefetch_workers=1)
+    first = conn.prefetch('slow')[0]
+    assert started.wait(5)
+    assert conn.prefetch('slow')[0] is first
+
+    result = []
+    reader = threading.Thread(target=lambda: result.append(conn.read_file('slow')))
+    reader.start()
+    release.set()
+    reader.join(5)
+
+    assert result == [b'slow']
+    assert gateway_requests(requests_mock, '/bzz/slow') == 1
+    conn.close()
+
+
+def test_prefetch_priority_order(requests_mock):
+    order = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(request, context):
+        name = request.path.split('/')[2]
+        if name == 'blocker':
+            started.set()
+            release.wait(5)
+        order.append(name)
+        context.status_code = 200
+        return name.encode('utf-8')
+
+    mock_bzz_link(requests_mock, {})
+    requests_mock.get('http://not-real-test-gateway-url/bzz/blocker', content=handler)
+    for name in ['low', 'high', 'bumped']:
+        requests_mock.get('http://not-real-test-gateway-url/bzz/%s' % name, content=handler)
+
+    conn = SwarmConnection(prefetch_workers=1)
+    conn.prefetch('blocker')
+    assert started.wait(5)
+    conn.prefetch(['low', 'bumped'], priority=1)
+    conn.prefetch('high', priority=5)
+    conn.prefetch('bumped', priority=10)
+    release.set()
+    for f in conn.prefetch(['low', 'high', 'bumped']):
+        f.result(timeout=5)
+
+    assert order == ['blocker', 'bumped', 'high', 'low']
+
+    prefetcher = conn._prefetcher
+    conn.close()
+    with pytest.raises(RuntimeError):
+        prefetcher.submit('low')
+
+
+def test_cancelled_prefetch_does_not_stop_the_worker(requests_mock):
+    started = threading.Event()
+    release = threading.Event()
+
+    def handler(request, context):
+        name = request.path.split('/')[2]
+        if name == 'blocker':
+            started.set()
+            release.wait(5)
+        context.status_code = 200
+        return name.encode('utf-8')
+
+    mock_bzz_link(requests_mock, {})
+    for name in ['blocker', 'cancelled', 'queued']:
+        requests_mock.get('http://not-real-test-gateway-url/bzz/%s' % name, content=handler)
+
+    conn = SwarmConnection(prefetch_workers=1)
+    conn.prefetch('blocker')
+    assert started.wait(5)
+    cancelled, queued = conn.prefetch(['cancelled', 'queued'])
+    assert cancelled.cancel()
+    release.set()
+
+    queued.result(timeout=5)
+    assert gateway_requests(requests_mock, '/bzz/cancelled') == 0
+    # a cancelled reference can be prefetched again and read
+    conn.prefetch('cancelled')[0].result(timeout=5)
+    assert conn.read_file('cancelled') == b'cancelled'
+    conn.close()
+
+
+def test_warm_cache_from_manifest(requests_mock, tmp_path):
+    mock_bzz_link(requests_mock, {'a': b'a', 'b': b'b', 'c': b'c'})
+
+    lines = tmp_path / 'refs.txt'
+    lines.write_text('# references\na\n\nb\n')
+    assert load_manifest_references(str(lines)) == ['a', 'b']
+
+    dataset = tmp_path / 'manifest.json'
+    dataset.write_text(json.dumps({'format': 'mipasa-swarm-dataset', 'partitions': [{'reference': 'c'}]}))
+    assert load_manifest_references(str(dataset)) == ['c']
+
+    listing = tmp_path / 'list.json'
+    listing.write_text(json.dumps(['a', 'c']))
+    assert load_manifest_references(str(listing)) == ['a', 'c']
+
+    invalid = tmp_path / 'invalid.json'
+    invalid.write_text(json.dumps({'a': 1}))
+    with pytest.raises(ValueError):
+        load_manifest_references(str(invalid))
+
+    conn = SwarmConnection()
+    for f in conn.warm_cache(str(lines)) + conn.warm_cache(str(dataset)):
+        f.result(timeout=5)
+    assert 'a' in conn.cache and 'b' in conn.cache and 'c' in conn.cache
+    conn.close()
@@ -0,0 +1,109 @@
+"""
+   Copyright 2020-2024 MiPasa
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+
+import hashlib
+import io
+import json
+import pytest
+import requests
+from mipasa_swarm_connector import SwarmConnection, Transport, RequestsTransport, HTTPXTransport
+
+
+httpx = pytest.importorskip('httpx')
+
+
+def mock_httpx_storage():
+    files = {}
+
+    def handler(request):
+        if request.method == 'POST':
+            content = request.read()
+            reference = hashlib.sha256(content).hexdigest()
+            files[reference] = (content, request.headers.get('Content-Type'))
+            return httpx.Response(201, json={'reference': reference})
+        reference = request.url.path.split('/')[-1]
+        if reference not in files:
+            return httpx.Response(404, json={'message': 'Not Found'})
+        content, mime_type = files[reference]
+        return httpx.Response(200, content=content, headers={'Content-Type': mime_type})
+
+    return files, HTTPXTransport(transport=httpx.MockTransport(handler))
+
+
+def test_default_transport_uses_session():
+    session = requests.Session()
+    conn = SwarmConnection('http://bee', session=session)
+    assert isinstance(conn.transport, RequestsTransport)
+    assert conn.transport.session is session
+
+
+def test_httpx_round_trip():
+    files, transport = mock_httpx_storage()
+    conn = SwarmConnection('http://bee', transport=transport)
+    swarm_hash = conn.write_file({'a': 1}, as_type='json')
+    assert files[swarm_hash][1] == 'application/json'
+    assert conn.read_json(swarm_hash) == {'a': 1}
+    assert conn.read_file(swarm_hash, as_type='bytes') == json.dumps({'a': 1}).encode('utf-8')
+
+
+def test_httpx_streams_files(tmp_path):
+    files, transport = mock_httpx_storage()
+    conn = SwarmConnection('http://bee', transport=transport)
+    path = tmp_path / 'data.bin'
+    path.write_bytes(b'\x01' * 200000)
+    with open(path, 'rb') as f:
+        swarm_hash = conn.write_from_file(f, 'data.bin')
+    assert files[swarm_hash][0] == b'\x01' * 200000
+    out = io.BytesIO()
+    conn.read_to_file(swarm_hash, out)
+    assert out.getvalue() == b'\x01' * 200000
+
+
+def test_custom_transport():
+    class RecordingTransport(Transport):
+        def __init__(self):
+            self.inner = mock_httpx_storage()[1]
+            self.calls = []
+
+        def request(self, method, url, data=None, headers=None, stream=False):
+            self.calls.append((method, url))
+            return self.inner.request(method, url, data=data, headers=headers, stream=stream)
+
+    transport = RecordingTransport()
+    conn = SwarmConnection('http://bee', transport=transport)
+    swarm_hash = conn.write_file(b'abc', as_type='bytes')
+    assert conn.read_file(swarm_hash, as_type='bytes') == b'abc'
+    assert [method for method, _ in transport.calls] == ['POST', 'GET']
+
+
+def test_close_closes_transport():
+    _, transport = mock_httpx_storage()
+    conn = SwarmConnection('http://bee', transport=transport)
+    conn.close()
+    assert transport.client.is_closed
+
+
+def test_close_leaves_caller_clients_open(mocker):
+    session = requests.Session()
+    mocker.spy(session, 'close')
+    SwarmConnection('http://bee', session=session).close()
+    session.close.assert_not_called()
+
+    client = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(404)))
+    SwarmConnection('http://bee', transport=HTTPXTransport(client=client)).close()
+    assert not client.is_closed
+    client.close()
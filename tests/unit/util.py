@@ -15,6 +15,10 @@
 """
 
 import builtins
+import hashlib
+import json
+import re
+import urllib.parse
 
 
 class ImportErrorMock:
@@ -34,3 +38,39 @@ class ImportErrorMock:
         if should_be_stopped:
             raise ImportError('Mocked module failure: %s' % ', '.join(map(repr, should_be_stopped)))
         return self.original_import(module, *args, **kwargs)
+
+
+def mock_swarm_storage(requests_mock, gateway_url='http://not-real-test-gateway-url'):
+    # a minimal in-memory /bzz API: uploads are stored by their SHA-256 and can be read back
+    files = {}
+
+    def upload(request, context):
+        content = request.body
+        if hasattr(content, 'read'):
+            content = content.read()
+        elif not isinstance(content, bytes):
+            content = b''.join(content)
+        reference = hashlib.sha256(content).hexdigest()
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(request.url).query)
+        files[reference] = {
+            'content': content,
+            'headers': {
+                'Content-Type': request.headers.get('Content-Type', 'application/octet-stream'),
+                'Content-Disposition': 'inline; filename="%s"' % query.get('file_name', ['file.bin'])[0],
+            },
+        }
+        context.status_code = 201
+        return json.dumps({'reference': reference}).encode('utf-8')
+
+    def download(request, context):
+        reference = urllib.parse.unquote(request.path.split('/')[2])
+        if reference not in files:
+            context.status_code = 404
+            return b'{"error": "Not found"}'
+        context.status_code = 200
+        context.headers = dict(files[reference]['headers'])
+        return files[reference]['content']
+
+    requests_mock.post(re.compile('^%s/bzz\\?.*$' % re.escape(gateway_url)), content=upload)
+    requests_mock.get(re.compile('^%s/bzz/.*$' % re.escape(gateway_url)), content=download)
+    return files, gateway_url